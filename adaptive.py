@@ -0,0 +1,93 @@
+import fnmatch
+import math
+import operator
+import time
+import psutil
+from alert_rules import AlertRule, configured_rules
+
+# Adaptive sampling: every source runs at max_interval while its metrics are
+# far from their alert rules, and faster as a value gets close to a threshold
+# or heads to it fast, down to min_interval. On battery the intervals are
+# stretched by BATTERY_FACTOR.
+DEFAULT_MIN_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 30
+# Distance to the threshold, relative to it, under which a source speeds up
+PROXIMITY_BAND = 0.5
+# At its current speed a value must need this many runs to reach its threshold
+RUNS_TO_THRESHOLD = 4
+BATTERY_FACTOR = 2
+BATTERY_CHECK_INTERVAL = 60
+
+
+class Battery:
+    # psutil.sensors_battery() costs a few file reads, so it is read once a minute
+    def __init__(self):
+        self.checked = -math.inf
+        self.discharging = False
+
+    def on_battery(self, now):
+        if now - self.checked >= BATTERY_CHECK_INTERVAL:
+            self.checked = now
+            try:
+                battery = psutil.sensors_battery()
+            except (AttributeError, NotImplementedError, OSError):
+                battery = None
+            self.discharging = battery is not None and battery.power_plugged is False
+        return self.discharging
+
+
+class AdaptiveIntervals:
+    # interval() gives the next interval of a source from the values it just
+    # read. O(rules of its metrics) per run, the rules of each metric are
+    # looked up once.
+    def __init__(self, config):
+        self.min_interval = config.get("adaptive_min_interval", DEFAULT_MIN_INTERVAL)
+        self.max_interval = max(self.min_interval, config.get("adaptive_max_interval", DEFAULT_MAX_INTERVAL))
+        self.battery = Battery() if config.get("adaptive_battery_backoff", True) else None
+        self.rules = []
+        for text in configured_rules(config):
+            try:
+                self.rules.append(AlertRule(text))
+            except ValueError:
+                # Reported by the alert engine
+                continue
+        self.by_metric = {}
+        # Previous (time, value) of each metric with a rule, for its speed
+        self.previous = {}
+
+    def rules_for(self, metric):
+        rules = self.by_metric.get(metric)
+        if rules is None:
+            rules = [(rule.compare in (operator.gt, operator.ge), rule.threshold)
+                     for rule in self.rules if fnmatch.fnmatchcase(metric, rule.metric)]
+            self.by_metric[metric] = rules
+        return rules
+
+    def interval(self, source, values, now=None):
+        now = now if now is not None else time.monotonic()
+        # A source slower than max_interval by default keeps its own pace when calm
+        interval = max(self.max_interval, source.interval)
+        for metric, value in values.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or math.isnan(value):
+                continue
+            rules = self.rules_for(metric)
+            if not rules:
+                continue
+            previous = self.previous.get(metric)
+            self.previous[metric] = (now, value)
+            for above, threshold in rules:
+                # How far the value is from firing, in units of the threshold
+                margin = (threshold - value) if above else (value - threshold)
+                scale = abs(threshold) or 1
+                closeness = min(max(margin / scale / PROXIMITY_BAND, 0), 1)
+                interval = min(interval, self.min_interval + (self.max_interval - self.min_interval) * closeness)
+                # Heading to the threshold: leave a few runs before it is reached
+                if previous and now > previous[0] and margin > 0:
+                    speed = (value - previous[1]) / (now - previous[0])
+                    toward = speed if above else -speed
+                    if toward > 0:
+                        interval = min(interval, margin / toward / RUNS_TO_THRESHOLD)
+        interval = max(interval, self.min_interval)
+        if self.battery and self.battery.on_battery(now):
+            interval *= BATTERY_FACTOR
+        return interval
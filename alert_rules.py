@@ -0,0 +1,187 @@
+import fnmatch
+import math
+import operator
+import re
+from collections import deque
+from mounts import mount_id
+
+# Rules are written like:
+#   cpu > 90                      one sample above the threshold
+#   cpu > 90 for 60s              above the threshold for 60 seconds in a row
+#   avg(ram, 5m) > 85             average of the last 5 minutes
+#   disk < 5 clear 8              fires under 5, resolves only once back above 8
+#   disk.* < 1                    a rule of its own for every mount, except the
+#                                 mounts named by another rule (disk.var < 5)
+RULE_PATTERN = re.compile(
+    r'^\s*(?:(?P<aggregate>avg|min|max)\(\s*(?P<agg_metric>[\w.*-]+)\s*,\s*(?P<window>\w+)\s*\)|(?P<metric>[\w.*-]+))'
+    r'\s*(?P<op>>=|<=|>|<)\s*(?P<threshold>-?[\d.]+)'
+    r'(?:\s+clear\s+(?P<clear>-?[\d.]+))?'
+    r'(?:\s+for\s+(?P<duration>\w+))?\s*$'
+)
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 24 * 3600}
+
+INACTIVE = "inactive"
+PENDING = "pending"
+FIRING = "firing"
+RESOLVED = "resolved"
+
+
+def parse_duration(text):
+    if text[-1] in UNITS:
+        return float(text[:-1]) * UNITS[text[-1]]
+    return float(text)
+
+
+class SlidingWindow:
+    # avg, min or max over the last seconds, updated in O(1) amortized per sample:
+    # a running sum for avg, a monotonic deque for min and max
+    def __init__(self, aggregate, seconds):
+        self.aggregate = aggregate
+        self.seconds = seconds
+        self.samples = deque()
+        self.total = 0.0
+
+    def add(self, timestamp, value):
+        if self.aggregate == "avg":
+            self.samples.append((timestamp, value))
+            self.total += value
+        else:
+            better = operator.le if self.aggregate == "min" else operator.ge
+            while self.samples and better(value, self.samples[-1][1]):
+                self.samples.pop()
+            self.samples.append((timestamp, value))
+
+        cutoff = timestamp - self.seconds
+        while self.samples[0][0] <= cutoff:
+            _, old = self.samples.popleft()
+            if self.aggregate == "avg":
+                self.total -= old
+
+        if self.aggregate == "avg":
+            return self.total / len(self.samples)
+        return self.samples[0][1]
+
+
+class AlertRule:
+    def __init__(self, text):
+        match = RULE_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Invalid alert rule: {text}")
+        self.text = text.strip()
+        self.metric = match.group("metric") or match.group("agg_metric")
+        self.compare = OPERATORS[match.group("op")]
+        self.threshold = float(match.group("threshold"))
+        # Hysteresis: a firing rule resolves once the value crosses the clear level
+        clear = match.group("clear")
+        self.clear = float(clear) if clear is not None else self.threshold
+        self.duration = parse_duration(match.group("duration")) if match.group("duration") else 0
+        self.window = None
+        if match.group("aggregate"):
+            self.window = SlidingWindow(match.group("aggregate"), parse_duration(match.group("window")))
+
+        self.state = INACTIVE
+        self.since = None
+        self.value = None
+
+    def is_cleared(self, value):
+        # Back on the other side of the clear level
+        if self.compare in (operator.gt, operator.ge):
+            return value < self.clear
+        return value > self.clear
+
+    def update(self, timestamp, value):
+        # Returns FIRING or RESOLVED on a transition, None otherwise
+        if self.window:
+            value = self.window.add(timestamp, value)
+        self.value = value
+
+        if self.state == FIRING:
+            if self.is_cleared(value):
+                self.state = INACTIVE
+                return RESOLVED
+            return None
+
+        if not self.compare(value, self.threshold):
+            self.state = INACTIVE
+            return None
+        if self.state == INACTIVE:
+            self.state = PENDING
+            self.since = timestamp
+        if timestamp - self.since >= self.duration:
+            self.state = FIRING
+            return FIRING
+        return None
+
+
+class AlertRuleEngine:
+    # Rules indexed by metric, so a sample only touches the rules of its metrics.
+    # A rule on a pattern (disk.*) is copied for each matching metric the first
+    # time that metric is seen.
+    def __init__(self, rules):
+        self.rules = []
+        self.patterns = []
+        self.by_metric = {}
+        for rule in rules:
+            try:
+                rule = AlertRule(rule) if isinstance(rule, str) else rule
+            except ValueError as e:
+                print(f"Ignored alert rule : {e}")
+                continue
+            if "*" in rule.metric:
+                self.patterns.append(rule)
+            else:
+                self.add(rule)
+        # Metrics named by a rule are not matched against the patterns
+        self.seen = set(self.by_metric)
+
+    def add(self, rule):
+        self.rules.append(rule)
+        self.by_metric.setdefault(rule.metric, []).append(rule)
+
+    def expand(self, stats):
+        for metric in stats.keys() - self.seen:
+            self.seen.add(metric)
+            for pattern in self.patterns:
+                if fnmatch.fnmatchcase(metric, pattern.metric):
+                    self.add(AlertRule(pattern.text.replace(pattern.metric, metric, 1)))
+
+    def evaluate(self, timestamp, stats):
+        # [(rule, FIRING or RESOLVED)] for this sample
+        if self.patterns:
+            self.expand(stats)
+        events = []
+        for metric, value in stats.items():
+            rules = self.by_metric.get(metric)
+            if rules is None or not isinstance(value, (int, float)) or math.isnan(value):
+                continue
+            for rule in rules:
+                event = rule.update(timestamp, value)
+                if event:
+                    events.append((rule, event))
+        return events
+
+    def firing(self):
+        return [rule for rule in self.rules if rule.state == FIRING]
+
+
+def default_rules(config):
+    # The thresholds of the settings window, as instant rules
+    rules = []
+    if config.get("monitor_cpu", True):
+        rules.append(f"cpu > {config.get('cpu_threshold', 90)}")
+    if config.get("monitor_ram", True):
+        rules.append(f"ram > {config.get('ram_threshold', 90)}")
+    if config.get("monitor_temp", True):
+        rules.append(f"temp > {config.get('temp_threshold', 90)}")
+    if config.get("monitor_disk", True):
+        # Free space of each mount, with its own threshold or the default one
+        for mountpoint, threshold in config.get("disk_thresholds", {}).items():
+            rules.append(f"disk.{mount_id(mountpoint)} < {threshold}")
+        rules.append(f"disk.* < {config.get('disk_threshold', 1)}")
+    return rules
+
+
+def configured_rules(config):
+    return default_rules(config) + list(config.get("alert_rules", []))
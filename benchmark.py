@@ -0,0 +1,364 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# The charts run on the offscreen platform, no display is needed
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from stats_blocks import write_blocks
+from stats_columns import ColumnWriter, MappedHistory
+from stats_storage import StatsStorage, read_stats, STATS_DIR, SEGMENT_PREFIX, BLOCKS_SUFFIX
+from stats_rollup import RollupTier, SketchTier, DEFAULT_SKETCH_METRICS, configured_tiers, tier_directory
+from sketches import SKETCH_TIERS
+
+# Hot paths of the storage, the queries, the Statistics window and the sampler
+# on synthetic histories of each size, one sample per second:
+#
+#   python benchmark.py --sizes 10000 1000000 --output results.json
+#   python benchmark.py --compare previous.json
+#
+# The results are JSON: the latencies in milliseconds, lower is better, and
+# the throughputs in "per_second", higher is better. --compare exits with 1
+# when a result got worse than the threshold, for a CI job between versions.
+DEFAULT_SIZES = [10000, 1000000, 10000000]
+# Samples per synthetic segment, a day like the storage rolls them
+SEGMENT_SAMPLES = 24 * 3600
+APPEND_SAMPLES = 20000
+# Reading the whole history as dicts takes gigabytes beyond this
+FULL_LOAD_LIMIT = 1000000
+QUERY_RANGES = [("15 min", 15 * 60), ("1 h", 3600), ("24 h", 24 * 3600), ("7 d", 7 * 24 * 3600)]
+# The ranges the Statistics window shows from a rollup tier
+ROLLUP_QUERY_RANGES = QUERY_RANGES[2:]
+QUERY_REPEATS = 50
+CHART_REPEATS = 5
+UPDATE_TICKS = 20
+SAMPLER_TICKS = 50
+DEFAULT_THRESHOLD = 1.25
+# Latency changes below this are timer noise, never a regression
+NOISE_MS = 0.1
+
+
+def percentiles(durations):
+    # Milliseconds, from perf_counter differences
+    ordered = sorted(durations)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    return {"p50_ms": pick(0.5), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def synthetic_sample(timestamp, rng):
+    # Daily and hourly waves with some noise, and a process ranking every minute
+    day = math.sin(timestamp * 2 * math.pi / 86400)
+    hour = math.sin(timestamp * 2 * math.pi / 3600)
+    sample = {
+        "timestamp": timestamp,
+        "cpu": max(0.0, min(100.0, 40 + 30 * day + 10 * hour + rng.uniform(-5, 5))),
+        "ram": 55 + 10 * day + rng.uniform(-1, 1),
+        "temp": 50 + 15 * day + rng.uniform(-2, 2),
+        "disk": 120 - timestamp % 86400 / 8640,
+        "disk_percent": 60 + timestamp % 86400 / 8640,
+        "net_recv": rng.expovariate(1 / 50000),
+        "load1": max(0.0, 2 + 1.5 * day + rng.uniform(-0.5, 0.5)),
+    }
+    if timestamp % 60 == 0:
+        sample["top_processes"] = {"cpu": [["python", 1234, 12.5]], "ram": [["firefox", 4321, 800.0]]}
+    return sample
+
+
+def write_segment(directory, columns, samples):
+    write_blocks(os.path.join(directory, f"{SEGMENT_PREFIX}{samples[0]['timestamp']:012d}{BLOCKS_SUFFIX}"), samples)
+    if columns:
+        for sample in samples:
+            columns.append(sample)
+
+
+def generate_history(directory, count, end, tiers, seed=0):
+    # Closed segments already compacted, and their column files, as the storage
+    # leaves them, for the raw samples, the rollup tiers of tiers and the sketches
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    columns = ColumnWriter(directory)
+    rollups = []
+    for name, bucket, retention in tiers[1:]:
+        tier = RollupTier(name, bucket, retention)
+        # The records of each segment, written with it
+        tier.storage = []
+        os.makedirs(tier_directory(directory, name), exist_ok=True)
+        rollups.append((tier, ColumnWriter(tier_directory(directory, name))))
+    for name, bucket, retention in SKETCH_TIERS:
+        tier = SketchTier(name, bucket, retention, DEFAULT_SKETCH_METRICS)
+        tier.storage = []
+        os.makedirs(tier_directory(directory, name), exist_ok=True)
+        rollups.append((tier, None))
+    start = end - count
+    for first in range(0, count, SEGMENT_SAMPLES):
+        samples = [synthetic_sample(start + i, rng) for i in range(first, min(count, first + SEGMENT_SAMPLES))]
+        write_segment(directory, columns, samples)
+        for tier, tier_columns in rollups:
+            for sample in samples:
+                tier.add(sample["timestamp"], sample)
+            if tier.storage:
+                write_segment(tier_directory(directory, tier.name), tier_columns, tier.storage)
+                tier.storage = []
+    columns.close()
+    for _, tier_columns in rollups:
+        if tier_columns:
+            tier_columns.close()
+
+
+def bench_append(storage, timestamps, rng):
+    durations = []
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        sample = synthetic_sample(timestamp, rng)
+        begin = time.perf_counter()
+        storage.append(sample)
+        durations.append(time.perf_counter() - begin)
+    storage.flush()
+    total = time.perf_counter() - start
+    return dict(percentiles(durations), per_second=len(timestamps) / total)
+
+
+def bench_load(directory, size, end):
+    results = {}
+    results["mapped_open_ms"] = timed(MappedHistory, directory)[0] * 1000
+    # What the rollup backfill reads at startup
+    results["read_last_hour_ms"] = timed(read_stats, directory, end - 3600)[0] * 1000
+    if size <= FULL_LOAD_LIMIT:
+        duration, samples = timed(read_stats, directory)
+        results["read_all_ms"] = duration * 1000
+        results["read_all_per_second"] = len(samples) / duration
+    return results
+
+
+def bench_query(history, end, metrics=("cpu",), ranges=QUERY_RANGES, steps=(None, 60)):
+    results = {}
+    for name, span in ranges:
+        for step in steps:
+            durations = []
+            for _ in range(QUERY_REPEATS):
+                begin = time.perf_counter()
+                for metric in metrics:
+                    timestamps, values = history.query(metric, end - span, end, step)
+                    # What the chart does with them: every value is read once
+                    sum(values)
+                durations.append(time.perf_counter() - begin)
+            results[name if step is None else f"{name} step {step}"] = dict(percentiles(durations), points=len(values))
+    return results
+
+
+def bench_rollup_query(directory, tiers, end):
+    # The averages of each rollup tier, and the _min/_max envelope the charts
+    # draw with them, the first query of a freshly opened history apart
+    results = {}
+    for name, _, _ in tiers[1:]:
+        duration, history = timed(MappedHistory, tier_directory(directory, name))
+        begin = time.perf_counter()
+        for metric in ("cpu_min", "cpu_max"):
+            sum(history.query(metric, end - ROLLUP_QUERY_RANGES[-1][1], end)[1])
+        first = time.perf_counter() - begin
+        results[name] = {
+            "open_ms": duration * 1000,
+            "envelope_first_ms": first * 1000,
+            "average": bench_query(history, end, ("cpu",), ROLLUP_QUERY_RANGES, (None,)),
+            "envelope": bench_query(history, end, ("cpu_min", "cpu_max"), ROLLUP_QUERY_RANGES, (None,)),
+        }
+        history.close()
+    return results
+
+
+def bench_chart(storage, timestamps, rng):
+    from PySide6.QtWidgets import QApplication
+    from stats_window import StatsWindow
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {}
+    duration, window = timed(StatsWindow)
+    results["open_ms"] = duration * 1000
+    window.show()
+    app.processEvents()
+
+    for name, _ in QUERY_RANGES:
+        window.range_combo.setCurrentText(name)
+        durations = []
+        for _ in range(CHART_REPEATS):
+            durations.append(timed(window.show_metric, "cpu", "CPU", "CPU utilisation(%)")[0])
+        results[f"show_chart {name}"] = dict(percentiles(durations), points=window.current_series.count(),
+                                             tier=window.current_tier)
+
+    # One new sample per tick, as the storage appends it
+    window.range_combo.setCurrentText("1 h")
+    durations = []
+    for timestamp in timestamps:
+        storage.append(synthetic_sample(timestamp, rng))
+        durations.append(timed(window.update_graph)[0])
+    results["update_graph"] = percentiles(durations)
+    window.close()
+    app.processEvents()
+    return results
+
+
+def bench_sampler():
+    # One tick of every real source and of the monitor, on this machine
+    from collector import SystemCollector
+    from monitor import Monitor, open_storage
+    collector = SystemCollector({})
+    config = {"notification_interval": 3600}
+    storage, downsampler = open_storage(config)
+    monitor = Monitor(config, storage, downsampler, lambda title, message: None)
+    collector.collect()
+    collect_durations = []
+    process_durations = []
+    cpu = 0
+    for _ in range(SAMPLER_TICKS):
+        time.sleep(0.02)
+        cpu_start = time.process_time()
+        duration, snapshot = timed(collector.collect)
+        collect_durations.append(duration)
+        process_durations.append(timed(monitor.process, snapshot)[0])
+        cpu += time.process_time() - cpu_start
+
+    # Then each source alone, to see which one costs the tick
+    sources = {source.name: [] for source in collector.sources}
+    for _ in range(SAMPLER_TICKS):
+        time.sleep(0.02)
+        for source in collector.sources:
+            sources[source.name].append(timed(source.collect)[0])
+    collector.close()
+    monitor.close()
+    return {
+        "collect": percentiles(collect_durations),
+        "process": percentiles(process_durations),
+        "cpu_ms_per_tick": cpu / SAMPLER_TICKS * 1000,
+        "sources": {name: percentiles(durations) for name, durations in sources.items()},
+    }
+
+
+def run_size(size, chart, tiers):
+    rng = random.Random(size)
+    now = int(time.time())
+    appended = min(size, APPEND_SAMPLES)
+    # The history ends where the appended samples start, they end now
+    end = now - appended - UPDATE_TICKS
+    directory = os.path.abspath(STATS_DIR)
+    results = {}
+    results["generate_s"] = timed(generate_history, directory, size, end, tiers)[0]
+
+    duration, storage = timed(StatsStorage, directory)
+    results["storage_open_ms"] = duration * 1000
+    results["append"] = bench_append(storage, range(end, end + appended), rng)
+    results["load"] = bench_load(directory, size, end + appended)
+    history = MappedHistory(directory)
+    results["query"] = bench_query(history, end + appended)
+    # The appended samples are not rolled up, the rollups end with the generated history
+    results["query_rollup"] = bench_rollup_query(directory, tiers, end)
+    if chart:
+        results["chart"] = bench_chart(storage, range(end + appended, now), rng)
+    storage.close()
+    shutil.rmtree(directory)
+    return results
+
+
+def flatten(results, prefix=""):
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not key.endswith(("points", "generate_s")):
+            values[prefix + key] = value
+    return values
+
+
+def compare(previous, current, threshold):
+    # The results worse than threshold times the previous ones
+    old = flatten(previous["results"])
+    new = flatten(current["results"])
+    regressions = []
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key] or not new[key]:
+            continue
+        ratio = new[key] / old[key]
+        if key.endswith("per_second"):
+            worse = ratio < 1 / threshold
+        else:
+            worse = ratio > threshold and new[key] - old[key] > NOISE_MS
+        print(f"{'WORSE' if worse else '':5} {key}: {old[key]:.4g} -> {new[key]:.4g} ({ratio:.2f}x)")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sentinelle storage, queries, charts and sampler")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="history sizes in samples")
+    parser.add_argument("--output", help="JSON file for the results, stdout otherwise")
+    parser.add_argument("--compare", help="previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="ratio counted as a regression")
+    parser.add_argument("--no-chart", action="store_true", help="leave out the Qt charts")
+    parser.add_argument("--no-sampler", action="store_true", help="leave out the sampler tick")
+    args = parser.parse_args()
+
+    report = {
+        "version": git_version(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    # Everything runs in a scratch directory: the config, the stats, the rollups
+    workdir = tempfile.mkdtemp(prefix="sentinelle-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # The default tiers: the long ranges are charted from the rollups, like in production
+        config = {}
+        with open("sentinel_config.json", "w") as file:
+            json.dump(config, file)
+        for size in args.sizes:
+            print(f"History of {size} samples...", file=sys.stderr)
+            report["results"][str(size)] = run_size(size, not args.no_chart, configured_tiers(config))
+        if not args.no_sampler:
+            print("Sampler ticks...", file=sys.stderr)
+            report["results"]["sampler"] = bench_sampler()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.threshold}x", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
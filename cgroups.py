@@ -0,0 +1,134 @@
+import fnmatch
+import os
+import re
+import time
+
+CGROUP_DIR = '/sys/fs/cgroup'
+# Hybrid hierarchy of systemd: the cgroup v2 tree under unified/
+UNIFIED_DIR = '/sys/fs/cgroup/unified'
+CGROUP_FILES = ("cpu.stat", "memory.current", "memory.max", "io.stat")
+# Without a selection, the root and the top level cgroups (system.slice, user.slice...)
+DEFAULT_CGROUP_DEPTH = 1
+# Each cgroup is up to 6 metrics and 4 open files
+DEFAULT_MAX_CGROUPS = 64
+
+
+def cgroup_root():
+    for directory in (CGROUP_DIR, UNIFIED_DIR):
+        if os.path.exists(os.path.join(directory, 'cgroup.controllers')):
+            return directory
+    return None
+
+
+def cgroup_id(path):
+    # Metric name part of a cgroup: system.slice/docker-1f2e.scope is system_slice_docker-1f2e_scope
+    return re.sub(r'[^\w-]+', '_', path.strip('/')) or "root"
+
+
+def cgroup_depth(path):
+    # 0 for the root, 1 for system.slice, 2 for system.slice/cron.service
+    return path.count('/') + 1 if path else 0
+
+
+def discover_cgroups(root, depth=None):
+    # The cgroups of the tree as {path relative to the root: directory}, down to depth
+    cgroups = {}
+    for directory, subdirectories, _ in os.walk(root):
+        path = os.path.relpath(directory, root).replace(os.sep, '/').lstrip('.')
+        cgroups[path] = directory
+        if depth is not None and cgroup_depth(path) >= depth:
+            subdirectories[:] = []
+    return cgroups
+
+
+def parse_keyed(text):
+    # "usage_usec 1234\nuser_usec ..." as {key: int}
+    values = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(" ")
+        if value.isdigit():
+            values[key] = int(value)
+    return values
+
+
+def parse_io(text):
+    # io.stat has a line per device, "8:0 rbytes=1 wbytes=2 ...": the sum of every device
+    totals = {}
+    for line in text.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if value.isdigit():
+                totals[key] = totals.get(key, 0) + int(value)
+    return totals
+
+
+class CgroupRegistry:
+    # cgroup v2 accounting files read through kept open file descriptors, one
+    # pread per file and per tick, so hundreds of cgroups stay cheap. The tree
+    # is walked again on a slow timer, and soon after a cgroup disappears.
+    # selection is a list of cgroup paths or glob patterns (system.slice/*),
+    # the cgroups down to depth when empty. A container host has hundreds of
+    # them, beyond limit the deepest ones are left out.
+    def __init__(self, selection=None, rescan_interval=60, root=None,
+                 depth=DEFAULT_CGROUP_DEPTH, limit=DEFAULT_MAX_CGROUPS):
+        self.selection = selection or []
+        self.rescan_interval = rescan_interval
+        self.root = root or cgroup_root()
+        self.depth = depth
+        self.limit = limit
+        self.handles = {}
+        self.next_rescan = 0
+        self.limit_reported = False
+
+    def selected(self, path):
+        if not self.selection:
+            return True
+        return any(fnmatch.fnmatchcase(path, pattern) for pattern in self.selection)
+
+    def rescan(self, now):
+        # A pattern may match at any depth
+        found = discover_cgroups(self.root, None if self.selection else self.depth)
+        paths = sorted((path for path in found if self.selected(path)), key=lambda path: (cgroup_depth(path), path))
+        if len(paths) > self.limit and not self.limit_reported:
+            print(f"Ignored {len(paths) - self.limit} cgroups beyond max_cgroups ({self.limit})")
+            self.limit_reported = True
+        cgroups = {path: found[path] for path in paths[:self.limit]}
+        for path in self.handles.keys() - cgroups.keys():
+            self.close_cgroup(path)
+        for path, directory in cgroups.items():
+            if path in self.handles:
+                continue
+            files = {}
+            for name in CGROUP_FILES:
+                try:
+                    files[name] = os.open(os.path.join(directory, name), os.O_RDONLY)
+                except OSError:
+                    # Controller not enabled for this cgroup
+                    pass
+            self.handles[path] = files
+        self.next_rescan = now + self.rescan_interval
+
+    def close_cgroup(self, path):
+        for fd in self.handles.pop(path, {}).values():
+            os.close(fd)
+
+    def read(self):
+        # {cgroup path: {file name: text}}
+        if self.root is None:
+            return {}
+        now = time.monotonic()
+        if now >= self.next_rescan:
+            self.rescan(now)
+        contents = {}
+        for path, files in list(self.handles.items()):
+            try:
+                contents[path] = {name: os.pread(fd, 65536, 0).decode() for name, fd in files.items()}
+            except OSError:
+                # Removed cgroup (stopped container), walk the tree again soon
+                self.close_cgroup(path)
+                self.next_rescan = min(self.next_rescan, now + 5)
+        return contents
+
+    def close(self):
+        for path in list(self.handles):
+            self.close_cgroup(path)
@@ -0,0 +1,78 @@
+import heapq
+import math
+import time
+from metric_sources import create_sources
+from diagnostics import diagnostics
+from adaptive import AdaptiveIntervals
+from psi import PressureTriggers
+
+
+class SystemCollector:
+    # Runs every metric source when it is due, from a heap ordered by due time
+    # (then cost), and merges their values into one sample stream. Only one
+    # collector should exist in the process: psutil.cpu_percent() measures
+    # since its previous call, wherever that call came from.
+    def __init__(self, config=None):
+        self.sources = []
+        self.heap = []
+        self.latest = {}
+        self.triggers = None
+        self.adaptive = None
+        self.intervals = {}
+        self.configure(config or {})
+
+    def configure(self, config):
+        self.close()
+        self.sources = create_sources(config)
+        # Stall events of the kernel, polled next to the sampling timer
+        self.triggers = PressureTriggers(config.get("psi_triggers", []) if config.get("monitor_psi", True) else [])
+        # Intervals following the distance to the alert thresholds, the fixed ones otherwise
+        self.adaptive = AdaptiveIntervals(config) if config.get("adaptive_sampling", False) else None
+        # Interval of the scheduled run of each source, by index
+        self.intervals = {index: source.interval for index, source in enumerate(self.sources)}
+        now = time.monotonic()
+        self.heap = [(now, source.cost, index, source) for index, source in enumerate(self.sources)]
+        heapq.heapify(self.heap)
+        self.latest = {}
+
+    def next_due(self):
+        # Monotonic time of the next source run
+        return self.heap[0][0] if self.heap else math.inf
+
+    def collect_due(self, now=None):
+        # Runs the due sources. The snapshot has the latest value of every metric,
+        # and in "fresh" the metrics read by this call.
+        now = now if now is not None else time.monotonic()
+        fresh = {}
+        with diagnostics.timer("sample"):
+            while self.heap and self.heap[0][0] <= now:
+                due, cost, index, source = heapq.heappop(self.heap)
+                diagnostics.source_run(due, now, self.intervals[index])
+                values = source.collect()
+                fresh.update(values)
+                interval = self.adaptive.interval(source, values, now) if self.adaptive else source.interval
+                self.intervals[index] = interval
+                # Keep the source on its own rate, a late run does not make it run twice
+                next_due = due + interval
+                if next_due <= now:
+                    next_due = now + interval
+                heapq.heappush(self.heap, (next_due, cost, index, source))
+        self.latest.update(fresh)
+
+        snapshot = {"timestamp": int(time.time())}
+        snapshot.update(self.latest)
+        snapshot["fresh"] = tuple(fresh)
+        return snapshot
+
+    def collect(self):
+        # Every source now
+        now = time.monotonic()
+        self.heap = [(now, cost, index, source) for _, cost, index, source in self.heap]
+        heapq.heapify(self.heap)
+        return self.collect_due(now)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+        if self.triggers:
+            self.triggers.close()
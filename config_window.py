@@ -1,6 +1,12 @@
 import sys
-from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QCheckBox, QLabel, QSpinBox, QComboBox, QPushButton, QWidget)
+from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QCheckBox, QLabel, QSpinBox, QComboBox, QPushButton, QWidget, QLineEdit, QPlainTextEdit, QGridLayout)
 from PySide6.QtGui import QIcon
+from sensors import discover_sensors
+from mounts import MountTable, DEFAULT_EXCLUDED_FSTYPES
+from metric_sources import SOURCES
+from metrics_server import DEFAULT_ADDRESS
+from adaptive import DEFAULT_MIN_INTERVAL, DEFAULT_MAX_INTERVAL
+from forecast import FAMILIES
 
 class ConfigWindow(QMainWindow):
     def __init__(self, config, save_config_callback):
@@ -12,21 +18,23 @@ class ConfigWindow(QMainWindow):
 
         layout = QVBoxLayout()
 
-        # Checkboxes for enable/disable the monitoring
-        self.monitor_cpu_checkbox = QCheckBox("Monitor CPU usage")
-        self.monitor_ram_checkbox = QCheckBox("Monitor RAM usage")
-        self.monitor_temp_checkbox = QCheckBox("Monitor the temperature")
-        self.monitor_disk_checkbox = QCheckBox("Monitor free space disk")
-
-        self.monitor_cpu_checkbox.setChecked(self.config.get("monitor_cpu", True))
-        self.monitor_ram_checkbox.setChecked(self.config.get("monitor_ram", True))
-        self.monitor_temp_checkbox.setChecked(self.config.get("monitor_temp", True))
-        self.monitor_disk_checkbox.setChecked(self.config.get("monitor_disk", True))
-
-        layout.addWidget(self.monitor_cpu_checkbox)
-        layout.addWidget(self.monitor_ram_checkbox)
-        layout.addWidget(self.monitor_temp_checkbox)
-        layout.addWidget(self.monitor_disk_checkbox)
+        # Checkboxes for enable/disable the monitoring, and the interval of each source
+        sources_layout = QGridLayout()
+        sources_layout.addWidget(QLabel("Interval (s), 0 for the default"), 0, 1)
+        self.monitor_checkboxes = {}
+        self.interval_spinboxes = {}
+        intervals = self.config.get("source_intervals", {})
+        for row, source in enumerate(SOURCES, start=1):
+            checkbox = QCheckBox(f"Monitor {source.label}")
+            checkbox.setChecked(self.config.get(f"monitor_{source.name}", True))
+            spinbox = QSpinBox()
+            spinbox.setRange(0, 3600)
+            spinbox.setValue(intervals.get(source.name, 0))
+            sources_layout.addWidget(checkbox, row, 0)
+            sources_layout.addWidget(spinbox, row, 1)
+            self.monitor_checkboxes[source.name] = checkbox
+            self.interval_spinboxes[source.name] = spinbox
+        layout.addLayout(sources_layout)
 
         # Spinners for alert thresholds and notification intervals
         layout.addWidget(QLabel("CPU alert treshold (%)"))
@@ -59,24 +67,106 @@ class ConfigWindow(QMainWindow):
         self.temp_display_checkbox.setChecked(self.config.get("display_temperature", True))
         layout.addWidget(self.temp_display_checkbox)
 
+        # Sensors to track, ids or patterns like coretemp_*
+        layout.addWidget(QLabel("Temperature sensors (comma separated, empty for all)"))
+        self.temp_sensors_edit = QLineEdit(", ".join(self.config.get("temp_sensors", [])))
+        self.temp_sensors_edit.setToolTip("Available sensors:\n" + "\n".join(discover_sensors()))
+        layout.addWidget(self.temp_sensors_edit)
+
+        # cgroups to track, paths or patterns like system.slice/*
+        layout.addWidget(QLabel("cgroups (comma separated, empty for the top level ones)"))
+        self.cgroups_edit = QLineEdit(", ".join(self.config.get("cgroups", [])))
+        self.cgroups_edit.setPlaceholderText("system.slice/*, docker/*")
+        layout.addWidget(self.cgroups_edit)
+
         layout.addWidget(QLabel("Disk treshold (Go)"))
         self.disk_threshold_spinbox = QSpinBox()
         self.disk_threshold_spinbox.setRange(1, 1000)
         self.disk_threshold_spinbox.setValue(self.config.get("disk_threshold", 1))
         layout.addWidget(self.disk_threshold_spinbox)
 
-        layout.addWidget(QLabel("Check interval (s)"))
+        # Threshold of some mounts, the others use the one above: "/var=5, /data=20"
+        layout.addWidget(QLabel("Disk tresholds per mount (Go)"))
+        thresholds = self.config.get("disk_thresholds", {})
+        self.disk_thresholds_edit = QLineEdit(", ".join(f"{mountpoint}={threshold}" for mountpoint, threshold in thresholds.items()))
+        self.disk_thresholds_edit.setPlaceholderText("/var=5, /data=20")
+        mounts = MountTable(self.config.get("disk_exclude_fstypes"))
+        self.disk_thresholds_edit.setToolTip("Monitored mounts:\n" + "\n".join(mounts.read().values()))
+        mounts.close()
+        layout.addWidget(self.disk_thresholds_edit)
+
+        layout.addWidget(QLabel("Filesystems not monitored (comma separated)"))
+        self.disk_exclude_edit = QLineEdit(", ".join(self.config.get("disk_exclude_fstypes", DEFAULT_EXCLUDED_FSTYPES)))
+        layout.addWidget(self.disk_exclude_edit)
+
+        layout.addWidget(QLabel("Default check interval (s)"))
         self.check_interval_spinbox = QSpinBox()
         self.check_interval_spinbox.setRange(1, 3600)
         self.check_interval_spinbox.setValue(self.config.get("check_interval", 5))
         layout.addWidget(self.check_interval_spinbox)
 
+        # Adaptive sampling: slow while the metrics are far from the alert thresholds, faster near them
+        self.adaptive_checkbox = QCheckBox("Adaptive sampling, faster near the alert thresholds")
+        self.adaptive_checkbox.setChecked(self.config.get("adaptive_sampling", False))
+        layout.addWidget(self.adaptive_checkbox)
+        adaptive_layout = QGridLayout()
+        adaptive_layout.addWidget(QLabel("Shortest interval (s)"), 0, 0)
+        self.adaptive_min_spinbox = QSpinBox()
+        self.adaptive_min_spinbox.setRange(1, 3600)
+        self.adaptive_min_spinbox.setValue(self.config.get("adaptive_min_interval", DEFAULT_MIN_INTERVAL))
+        adaptive_layout.addWidget(self.adaptive_min_spinbox, 0, 1)
+        adaptive_layout.addWidget(QLabel("Longest interval (s)"), 1, 0)
+        self.adaptive_max_spinbox = QSpinBox()
+        self.adaptive_max_spinbox.setRange(1, 3600)
+        self.adaptive_max_spinbox.setValue(self.config.get("adaptive_max_interval", DEFAULT_MAX_INTERVAL))
+        adaptive_layout.addWidget(self.adaptive_max_spinbox, 1, 1)
+        layout.addLayout(adaptive_layout)
+        self.battery_backoff_checkbox = QCheckBox("Sample less often on battery")
+        self.battery_backoff_checkbox.setChecked(self.config.get("adaptive_battery_backoff", True))
+        layout.addWidget(self.battery_backoff_checkbox)
+
+        # Predictive alerts: a threshold reached within the horizon at the current trend
+        self.forecast_checkbox = QCheckBox("Alert before the thresholds are reached, from the trends")
+        self.forecast_checkbox.setChecked(self.config.get("forecast_alerts", True))
+        layout.addWidget(self.forecast_checkbox)
+        forecast_layout = QGridLayout()
+        horizons = self.config.get("forecast_horizons", {})
+        self.forecast_horizon_spinboxes = {}
+        for row, (family, label) in enumerate([("disk", "Disk horizon (min)"), ("ram", "RAM horizon (min)"), ("temp", "Temperature horizon (min)")]):
+            forecast_layout.addWidget(QLabel(label), row, 0)
+            spinbox = QSpinBox()
+            spinbox.setRange(1, 7 * 24 * 60)
+            spinbox.setValue(int(horizons.get(family, FAMILIES[family][1]) // 60))
+            forecast_layout.addWidget(spinbox, row, 1)
+            self.forecast_horizon_spinboxes[family] = spinbox
+        layout.addLayout(forecast_layout)
+
         layout.addWidget(QLabel("Notification repeat interval(s)"))
         self.notification_interval_spinbox = QSpinBox()
         self.notification_interval_spinbox.setRange(1, 3600)
         self.notification_interval_spinbox.setValue(self.config.get("notification_interval", 60))
         layout.addWidget(self.notification_interval_spinbox)
 
+        # Extra alert rules, one per line: "cpu > 90 for 60s", "avg(ram, 5m) > 85", "disk < 5 clear 8"
+        layout.addWidget(QLabel("Alert rules (one per line)"))
+        self.alert_rules_edit = QPlainTextEdit("\n".join(self.config.get("alert_rules", [])))
+        self.alert_rules_edit.setPlaceholderText("cpu > 90 for 60s\navg(ram, 5m) > 85\ndisk < 5 clear 8")
+        layout.addWidget(self.alert_rules_edit)
+
+        # Kernel PSI triggers, notified as soon as the stall happens: "memory some 150ms 2s"
+        layout.addWidget(QLabel("Pressure stall triggers (one per line)"))
+        self.psi_triggers_edit = QPlainTextEdit("\n".join(self.config.get("psi_triggers", [])))
+        self.psi_triggers_edit.setPlaceholderText("memory some 150ms 2s\nio full 500ms 2s")
+        layout.addWidget(self.psi_triggers_edit)
+
+        # Local endpoint for scrapers: /metrics in OpenMetrics format, /api/query for the history
+        self.server_checkbox = QCheckBox("Serve the metrics (OpenMetrics and JSON) on")
+        self.server_checkbox.setChecked(self.config.get("server_enabled", False))
+        layout.addWidget(self.server_checkbox)
+        self.server_address_edit = QLineEdit(self.config.get("server_address", DEFAULT_ADDRESS))
+        self.server_address_edit.setToolTip("host:port, or unix:/path/to/socket")
+        layout.addWidget(self.server_address_edit)
+
         # Save button
         save_button = QPushButton("Save")
         save_button.clicked.connect(self.save_config)
@@ -88,17 +178,41 @@ class ConfigWindow(QMainWindow):
         self.setCentralWidget(central_widget)
 
     def save_config(self):
-        self.config["monitor_cpu"] = self.monitor_cpu_checkbox.isChecked()
-        self.config["monitor_ram"] = self.monitor_ram_checkbox.isChecked()
-        self.config["monitor_temp"] = self.monitor_temp_checkbox.isChecked()
-        self.config["monitor_disk"] = self.monitor_disk_checkbox.isChecked()
+        for name, checkbox in self.monitor_checkboxes.items():
+            self.config[f"monitor_{name}"] = checkbox.isChecked()
+        self.config["source_intervals"] = {name: spinbox.value() for name, spinbox in self.interval_spinboxes.items() if spinbox.value()}
         self.config["cpu_threshold"] = self.cpu_threshold_spinbox.value()
         self.config["ram_threshold"] = self.ram_threshold_spinbox.value()
         self.config["temp_threshold"] = self.temp_threshold_spinbox.value()
         self.config["temperature_unit"] = self.temp_unit_combo.currentText()
         self.config["display_temperature"] = self.temp_display_checkbox.isChecked()
+        self.config["temp_sensors"] = [name.strip() for name in self.temp_sensors_edit.text().split(",") if name.strip()]
+        self.config["cgroups"] = [path.strip() for path in self.cgroups_edit.text().split(",") if path.strip()]
         self.config["disk_threshold"] = self.disk_threshold_spinbox.value()
+        self.config["disk_thresholds"] = self.parse_disk_thresholds(self.disk_thresholds_edit.text())
+        self.config["disk_exclude_fstypes"] = [fstype.strip() for fstype in self.disk_exclude_edit.text().split(",") if fstype.strip()]
         self.config["check_interval"] = self.check_interval_spinbox.value()
+        self.config["adaptive_sampling"] = self.adaptive_checkbox.isChecked()
+        self.config["adaptive_min_interval"] = self.adaptive_min_spinbox.value()
+        self.config["adaptive_max_interval"] = max(self.adaptive_min_spinbox.value(), self.adaptive_max_spinbox.value())
+        self.config["adaptive_battery_backoff"] = self.battery_backoff_checkbox.isChecked()
+        self.config["forecast_alerts"] = self.forecast_checkbox.isChecked()
+        self.config["forecast_horizons"] = {family: spinbox.value() * 60 for family, spinbox in self.forecast_horizon_spinboxes.items()}
         self.config["notification_interval"] = self.notification_interval_spinbox.value()
+        self.config["alert_rules"] = [rule.strip() for rule in self.alert_rules_edit.toPlainText().splitlines() if rule.strip()]
+        self.config["psi_triggers"] = [trigger.strip() for trigger in self.psi_triggers_edit.toPlainText().splitlines() if trigger.strip()]
+        self.config["server_enabled"] = self.server_checkbox.isChecked()
+        self.config["server_address"] = self.server_address_edit.text().strip() or DEFAULT_ADDRESS
         self.save_config_callback(self.config)
         self.close()
+
+    def parse_disk_thresholds(self, text):
+        thresholds = {}
+        for item in text.split(","):
+            mountpoint, _, threshold = item.partition("=")
+            try:
+                thresholds[mountpoint.strip()] = float(threshold)
+            except ValueError:
+                if item.strip():
+                    print(f"Ignored disk treshold : {item.strip()}")
+        return thresholds
@@ -1,20 +1,21 @@
 import sys
-import psutil
 import json
 import os
-from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QWidget, QLabel, QProgressBar, QApplication)
+from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QProgressBar, QApplication)
 from PySide6.QtGui import QIcon
-from PySide6.QtCore import QTimer
+from sampler import Sampler
+from top_processes_panel import TopProcessesPanel
 
 CONFIG_FILE = 'sentinel_config.json'
 STATS_FILE = 'sentinel_stats.json'
 
 class CurrentInfoWindow(QMainWindow):
-    def __init__(self):
+    # Shows the snapshots of the shared sampler, it does not read the system itself
+    def __init__(self, sampler):
         super().__init__()
         self.setWindowTitle("Real time statistics")
         self.setWindowIcon(QIcon("sentinelle.png"))
-        self.setGeometry(100, 100, 600, 400)
+        self.setGeometry(100, 100, 1000, 400)
 
         # Loading the configuration
         self.config = self.load_config()
@@ -39,22 +40,29 @@ class CurrentInfoWindow(QMainWindow):
         layout.addWidget(self.temp_label)
         layout.addWidget(self.temp_display)
 
-        self.disk_label = QLabel("Space Disk :")
-        self.disk_progress = QProgressBar()
-        self.disk_progress.setRange(0, 100)
-        layout.addWidget(self.disk_label)
-        layout.addWidget(self.disk_progress)
+        # One bar per mount, added when the mount first shows up
+        self.disk_layout = QVBoxLayout()
+        self.disk_progress = {}
+        layout.addLayout(self.disk_layout)
 
-        # Timer for progress bar update
-        self.update_timer = QTimer()
-        self.update_timer.timeout.connect(self.update_progress)
-        self.update_timer.start(self.config.get("update_interval", 5000))  # Update evey 5 seconds
+        # Top processes next to the progress bars
+        self.top_processes_panel = TopProcessesPanel()
+        main_layout = QHBoxLayout()
+        main_layout.addLayout(layout)
+        main_layout.addWidget(self.top_processes_panel)
 
         # Widget central
         central_widget = QWidget()
-        central_widget.setLayout(layout)
+        central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
 
+        # Progress bars follow the sampler snapshots
+        sampler.snapshot_ready.connect(self.update_progress)
+        sampler.snapshot_ready.connect(self.top_processes_panel.update_processes)
+        if sampler.latest:
+            self.update_progress(sampler.latest)
+            self.top_processes_panel.update_processes(sampler.latest)
+
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as f:
@@ -69,19 +77,16 @@ class CurrentInfoWindow(QMainWindow):
                 "notification_interval": 60000  # 1 minute
             }
 
-    def update_progress(self):
+    def update_progress(self, snapshot):
         # Update the CPU utilisation
-        cpu_usage = psutil.cpu_percent()
-        self.cpu_progress.setValue(cpu_usage)
+        self.cpu_progress.setValue(snapshot.get("cpu", 0))
 
         # Update the RAM utilisation
-        ram_usage = psutil.virtual_memory().percent
-        self.ram_progress.setValue(ram_usage)
+        self.ram_progress.setValue(snapshot.get("ram", 0))
 
         # Update the temperature
-        temp = psutil.sensors_temperatures()
-        if temp:
-            temp_value = temp[list(temp.keys())[0]][0].current
+        if "temp" in snapshot:
+            temp_value = snapshot["temp"]
             if self.config.get("temperature_unit") == "Fahrenheit (°F)":
                 temp_value = temp_value * 9/5 + 32
             self.temp_display.setText(f"Temperature: {temp_value:.1f} {self.config.get('temperature_unit')}")
@@ -89,11 +94,28 @@ class CurrentInfoWindow(QMainWindow):
             self.temp_display.setText("Temperature: Unavailable")
 
         # Update Space disk
-        disk_usage = psutil.disk_usage('/').percent
-        self.disk_progress.setValue(disk_usage)
+        for metric, value in snapshot.items():
+            if not metric.startswith("disk_percent."):
+                continue
+            identifier = metric[len("disk_percent."):]
+            if identifier not in self.disk_progress:
+                self.add_disk_progress(identifier)
+            self.disk_progress[identifier].setValue(value)
+
+    def add_disk_progress(self, identifier):
+        label = QLabel(f"Space Disk {'/' if identifier == 'root' else identifier} :")
+        progress = QProgressBar()
+        progress.setRange(0, 100)
+        self.disk_layout.addWidget(label)
+        self.disk_layout.addWidget(progress)
+        self.disk_progress[identifier] = progress
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    window = CurrentInfoWindow()
+    sampler = Sampler()
+    window = CurrentInfoWindow(sampler)
+    sampler.start()
     window.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    sampler.stop()
+    sys.exit(exit_code)
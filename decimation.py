@@ -0,0 +1,84 @@
+import math
+
+# Reduce a line to what a chart of a given width can show.
+# xs must be sorted, both functions return new (xs, ys) lists.
+
+
+def minmax(xs, ys, columns):
+    # Keep the lowest and the highest point of every pixel column, so spikes always show
+    count = len(xs)
+    if columns <= 0 or count <= 2 * columns:
+        return list(xs), list(ys)
+    x_first = xs[0]
+    width = (xs[-1] - x_first) or 1
+    out_x = []
+    out_y = []
+    bucket = -1
+    low = high = 0
+    for i in range(count):
+        current = min(int((xs[i] - x_first) * columns / width), columns - 1)
+        if current != bucket:
+            if bucket >= 0:
+                flush_bucket(xs, ys, low, high, out_x, out_y)
+            bucket = current
+            low = high = i
+        elif ys[i] < ys[low]:
+            low = i
+        elif ys[i] > ys[high]:
+            high = i
+    flush_bucket(xs, ys, low, high, out_x, out_y)
+    return out_x, out_y
+
+
+def flush_bucket(xs, ys, low, high, out_x, out_y):
+    for i in sorted({low, high}):
+        out_x.append(xs[i])
+        out_y.append(ys[i])
+
+
+def lttb(xs, ys, threshold):
+    # Largest Triangle Three Buckets: keeps the point of each bucket that makes the
+    # largest triangle with the previous kept point and the average of the next bucket
+    count = len(xs)
+    if threshold < 3 or count <= threshold:
+        return list(xs), list(ys)
+    out_x = [xs[0]]
+    out_y = [ys[0]]
+    every = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+
+        # Average point of the next bucket
+        next_start = end
+        span = next_end - next_start
+        if span > 0:
+            avg_x = sum(xs[next_start:next_end]) / span
+            avg_y = sum(ys[next_start:next_end]) / span
+        else:
+            avg_x = xs[-1]
+            avg_y = ys[-1]
+
+        best = start
+        best_area = -1
+        px = xs[previous]
+        py = ys[previous]
+        for i in range(start, end):
+            area = math.fabs((px - avg_x) * (ys[i] - py) - (px - xs[i]) * (avg_y - py))
+            if area > best_area:
+                best_area = area
+                best = i
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        previous = best
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+def decimate(xs, ys, width, method="minmax"):
+    if method == "lttb":
+        return lttb(xs, ys, width)
+    return minmax(xs, ys, width)
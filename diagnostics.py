@@ -0,0 +1,136 @@
+import math
+import time
+from bisect import bisect_left
+
+# Sentinelle's own hot paths: the sources, the monitor tick, the storage, the
+# alert rules and the charts are timed into fixed bucket histograms, and the
+# late or missed source runs are counted. The process itself (CPU, RSS, I/O)
+# is read by the "self" metric source, which also switches this on and off.
+#
+# Disabled, timer() hands out one shared do nothing context manager, so the
+# instrumented code pays a method call and nothing else.
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, math.inf)
+# A source run this late, relative to its interval, is counted as late
+LATE_FRACTION = 0.1
+LATE_MIN = 0.05
+
+
+class Histogram:
+    # Updated from the sampler thread, the GUI thread and the server threads
+    # without a lock: a count lost to a race is fine for diagnostics
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the quantile, the max for the last one
+        rank = fraction * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank and cumulative:
+                return min(bound, self.max)
+        return 0.0
+
+
+class Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Diagnostics:
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+
+    def enable(self, enabled):
+        self.enabled = enabled
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, name):
+        # with diagnostics.timer("storage.append"): ...
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.histogram(name))
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def source_run(self, due, now, interval):
+        # A source of the collector ran at now instead of due
+        if not self.enabled:
+            return
+        lateness = now - due
+        self.histogram("lateness").record(max(lateness, 0.0))
+        if lateness > max(LATE_MIN, interval * LATE_FRACTION):
+            self.count("late_runs")
+        if interval and lateness >= interval:
+            self.count("missed_runs", int(lateness // interval))
+
+    def openmetrics(self):
+        # The histograms and the counters as OpenMetrics lines, without the # EOF
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            family = "sentinelle_self_" + name.replace(".", "_") + "_seconds"
+            lines.append(f"# TYPE {family} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                label = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'{family}_bucket{{le="{label}"}} {cumulative}')
+            lines.append(f"{family}_count {histogram.count}")
+            lines.append(f"{family}_sum {histogram.total!r}")
+        for name, value in sorted(self.counters.items()):
+            family = "sentinelle_self_" + name
+            lines.append(f"# TYPE {family} counter")
+            lines.append(f"{family}_total {value}")
+        return lines
+
+
+# Shared by every module of the process
+diagnostics = Diagnostics()
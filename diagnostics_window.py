@@ -0,0 +1,126 @@
+import math
+from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QGridLayout, QWidget, QLabel, QTableWidget, QTableWidgetItem, QHeaderView)
+from PySide6.QtGui import QIcon, QPainter
+from PySide6.QtCore import QTimer, Qt
+from PySide6.QtCharts import QChart, QChartView, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
+from diagnostics import diagnostics, BUCKETS
+
+COLUMNS = ["Timer", "Count", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Max (ms)"]
+# Process values of the "self" source: (metric, label, format)
+PROCESS_VALUES = [
+    ("self.cpu", "CPU", "{:.1f} %"),
+    ("self.rss", "Memory (RSS)", "{:.1f} Mo"),
+    ("self.threads", "Threads", "{:.0f}"),
+    ("self.io_read", "Disk read", "{:.0f} B/s"),
+    ("self.io_write", "Disk write", "{:.0f} B/s"),
+    ("self.tick_ms", "Monitor tick", "{:.2f} ms"),
+]
+
+
+def bucket_label(bound):
+    if bound == math.inf:
+        return "more"
+    return f"{bound * 1000:g}"
+
+
+class DiagnosticsWindow(QMainWindow):
+    # What Sentinelle itself costs: its process from the snapshots of the
+    # shared sampler, and the timers of its hot paths since the start
+    def __init__(self, sampler):
+        super().__init__()
+        self.setWindowTitle("Diagnostics")
+        self.setWindowIcon(QIcon("sentinelle.png"))
+        self.setGeometry(100, 100, 800, 700)
+        self.sampler = sampler
+
+        layout = QVBoxLayout()
+        self.state_label = QLabel()
+        layout.addWidget(self.state_label)
+
+        values_layout = QGridLayout()
+        self.value_labels = {}
+        for row, (metric, label, _) in enumerate(PROCESS_VALUES + [("late", "Late source runs", None), ("missed", "Missed source runs", None)]):
+            values_layout.addWidget(QLabel(f"{label}:"), row // 2, row % 2 * 2)
+            self.value_labels[metric] = QLabel("-")
+            values_layout.addWidget(self.value_labels[metric], row // 2, row % 2 * 2 + 1)
+        layout.addLayout(values_layout)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        # Distribution of the monitor tick latency, one bar per histogram bucket
+        self.tick_set = QBarSet("Monitor ticks")
+        self.tick_set.append([0] * len(BUCKETS))
+        series = QBarSeries()
+        series.append(self.tick_set)
+        chart = QChart()
+        chart.addSeries(series)
+        chart.setTitle("Monitor tick latency")
+        axis_x = QBarCategoryAxis()
+        axis_x.append([bucket_label(bound) for bound in BUCKETS])
+        axis_x.setTitleText("Up to (ms)")
+        chart.addAxis(axis_x, Qt.AlignBottom)
+        series.attachAxis(axis_x)
+        self.axis_y = QValueAxis()
+        self.axis_y.setLabelFormat("%d")
+        chart.addAxis(self.axis_y, Qt.AlignLeft)
+        series.attachAxis(self.axis_y)
+        chart.legend().setVisible(False)
+        chart_view = QChartView(chart)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+        layout.addWidget(chart_view)
+
+        central_widget = QWidget()
+        central_widget.setLayout(layout)
+        self.setCentralWidget(central_widget)
+
+        self.update_timer = QTimer()
+        self.update_timer.timeout.connect(self.refresh)
+        self.update_timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        if diagnostics.enabled:
+            self.state_label.setText("Timings since the start, the process values from the last sample.")
+        else:
+            self.state_label.setText('Diagnostics are off, enable "Monitor Sentinelle itself" in the settings.')
+
+        latest = self.sampler.latest or {}
+        for metric, _, text in PROCESS_VALUES:
+            value = latest.get(metric)
+            self.value_labels[metric].setText(text.format(value) if isinstance(value, (int, float)) else "-")
+        for name in ("late", "missed"):
+            self.value_labels[name].setText(str(diagnostics.counters.get(f"{name}_runs", 0)))
+
+        histograms = sorted(diagnostics.histograms.items())
+        self.table.setRowCount(len(histograms))
+        for row, (name, histogram) in enumerate(histograms):
+            cells = [
+                name,
+                str(histogram.count),
+                f"{histogram.mean() * 1000:.3f}",
+                f"{histogram.quantile(0.5) * 1000:.3f}",
+                f"{histogram.quantile(0.99) * 1000:.3f}",
+                f"{histogram.max * 1000:.3f}",
+            ]
+            for column, text in enumerate(cells):
+                item = self.table.item(row, column)
+                if item is None:
+                    self.table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+
+        tick = diagnostics.histograms.get("tick")
+        counts = tick.counts if tick else [0] * len(BUCKETS)
+        for index, count in enumerate(counts):
+            if self.tick_set.at(index) != count:
+                self.tick_set.replace(index, count)
+        self.axis_y.setRange(0, max(max(counts), 1))
+
+    def closeEvent(self, event):
+        self.update_timer.stop()
+        event.accept()
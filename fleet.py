@@ -0,0 +1,254 @@
+import errno
+import json
+import os
+import re
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from stats_storage import StatsStorage
+from stats_rollup import Downsampler, configured_tiers
+
+FLEET_DIR = 'sentinel_fleet'
+# Seconds without any line, heartbeats included, after which an agent is considered gone
+AGENT_TIMEOUT = 15
+MIN_RETRY_DELAY = 1
+MAX_RETRY_DELAY = 30
+# Samples decoded but not taken by the dashboard yet. Beyond this the
+# collector stops reading, and the agents drop their oldest samples.
+MAX_PENDING = 100000
+PRUNE_INTERVAL = 10 * 60
+
+# Current values of the dashboard, "worst" is the highest of them
+FLEET_METRICS = ("cpu", "ram", "temp", "disk_percent")
+
+
+def host_id(name):
+    return re.sub(r'[^\w.-]+', '_', name) or "unknown"
+
+
+def worst(latest):
+    return max((latest[metric] for metric in FLEET_METRICS if isinstance(latest.get(metric), (int, float))), default=0)
+
+
+class FleetHost:
+    # The tiered storage of one agent, under sentinel_fleet/<host>/
+    def __init__(self, name, config):
+        self.name = name
+        self.directory = os.path.join(FLEET_DIR, host_id(name))
+        # No column file here, the viewer builds it when the host is opened
+        self.storage = StatsStorage(self.directory, flush_interval=config.get("stats_flush_interval", 10), columns=False)
+        self.downsampler = Downsampler(self.storage, configured_tiers(config), config.get("sketch_metrics"))
+
+    def save(self, stats):
+        self.storage.append(stats)
+        self.downsampler.add(stats)
+
+    def close(self):
+        self.storage.close()
+        self.downsampler.close()
+
+
+class AgentConnection:
+    def __init__(self, address):
+        self.address = address
+        self.name = address
+        self.host = None
+        self.sock = None
+        self.buffer = b""
+        self.headers_read = False
+        self.retry_delay = MIN_RETRY_DELAY
+        self.next_attempt = 0
+        self.last_data = 0
+
+    def socket_address(self):
+        if self.address.startswith("unix:"):
+            return socket.AF_UNIX, self.address[len("unix:"):]
+        host, _, port = self.address.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+    def lines(self, data):
+        # The complete lines received, after the HTTP headers
+        self.buffer += data
+        if not self.headers_read:
+            headers, separator, rest = self.buffer.partition(b"\r\n\r\n")
+            if not separator:
+                return []
+            if b" 200 " not in headers.split(b"\r\n", 1)[0]:
+                raise ValueError(headers.split(b"\r\n", 1)[0].decode(errors="replace"))
+            self.headers_read = True
+            self.buffer = rest
+        *lines, self.buffer = self.buffer.split(b"\n")
+        return lines
+
+
+class FleetCollector:
+    # Streams the samples of every agent (GET /stream of their metrics server)
+    # in one thread: non blocking sockets on a selector, so a hundred agents
+    # cost one thread and no busy loop. An agent that leaves or stops talking
+    # is connected again with an exponential backoff. Each host gets its own
+    # storage; the dashboard takes the decoded samples with drain() from its
+    # own thread.
+    def __init__(self, config):
+        self.config = config
+        self.selector = selectors.DefaultSelector()
+        self.agents = [AgentConnection(address) for address in config.get("fleet_agents", [])]
+        self.hosts = {}
+        self.events = deque()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def drain(self):
+        # [("sample", host name, stats) or ("state", host name, connected)] since the last call
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def run(self):
+        next_prune = time.monotonic() + PRUNE_INTERVAL
+        while not self.stopping:
+            now = time.monotonic()
+            # Backpressure: leave the data in the sockets until the dashboard catches up.
+            # The agents are not read meanwhile, their timeout starts again after the pause.
+            if len(self.events) >= MAX_PENDING:
+                for agent in self.agents:
+                    agent.last_data = now
+                time.sleep(0.1)
+                continue
+
+            for agent in self.agents:
+                if agent.sock is None and now >= agent.next_attempt:
+                    self.connect(agent, now)
+                elif agent.sock is not None and now - agent.last_data > AGENT_TIMEOUT:
+                    self.disconnect(agent, now, "no data")
+
+            if not self.selector.get_map():
+                # Every agent is waiting for its next attempt
+                time.sleep(1)
+                continue
+            for key, events in self.selector.select(timeout=1):
+                agent = key.data
+                if events & selectors.EVENT_WRITE:
+                    self.connected(agent, now)
+                elif events & selectors.EVENT_READ:
+                    self.read(agent, now)
+
+            if now >= next_prune:
+                for host in self.hosts.values():
+                    host.downsampler.prune()
+                next_prune = now + PRUNE_INTERVAL
+
+        for agent in self.agents:
+            if agent.sock is not None:
+                self.disconnect(agent, time.monotonic(), None)
+        for host in self.hosts.values():
+            host.close()
+
+    def connect(self, agent, now):
+        try:
+            family, address = agent.socket_address()
+            agent.sock = socket.socket(family, socket.SOCK_STREAM)
+            agent.sock.setblocking(False)
+            error = agent.sock.connect_ex(address)
+        except (OSError, ValueError) as e:
+            self.disconnect(agent, now, e)
+            return
+        if error not in (0, errno.EINPROGRESS, errno.EAGAIN):
+            self.disconnect(agent, now, os.strerror(error))
+            return
+        agent.last_data = now
+        self.selector.register(agent.sock, selectors.EVENT_WRITE, agent)
+
+    def connected(self, agent, now):
+        error = agent.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.disconnect(agent, now, os.strerror(error))
+            return
+        try:
+            agent.sock.send(b"GET /stream HTTP/1.0\r\n\r\n")
+        except OSError as e:
+            self.disconnect(agent, now, e)
+            return
+        self.selector.modify(agent.sock, selectors.EVENT_READ, agent)
+
+    def read(self, agent, now):
+        try:
+            data = agent.sock.recv(65536)
+            if not data:
+                raise ConnectionResetError("connection closed")
+            lines = agent.lines(data)
+        except (OSError, ValueError) as e:
+            self.disconnect(agent, now, e)
+            return
+        agent.last_data = now
+        for line in lines:
+            if not line.strip():
+                # Heartbeat
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            try:
+                if agent.host is None:
+                    self.hello(agent, message)
+                elif "timestamp" in message:
+                    agent.host.save(message)
+                    self.events.append(("sample", agent.name, message))
+            except OSError as e:
+                # A full disk or a broken directory stops this host only
+                self.drop_host(agent, now, e)
+                return
+        # A working stream resets the backoff
+        agent.retry_delay = MIN_RETRY_DELAY
+
+    def hello(self, agent, message):
+        # First line of the stream: the host name. With the configured address
+        # of the agent, the same host always gets the same name and storage,
+        # whatever else is connected, and two hosts reporting one name never share it.
+        host = message.get("host")
+        name = f"{host}@{agent.address}" if host else agent.address
+        agent.name = name
+        if name not in self.hosts:
+            self.hosts[name] = FleetHost(name, self.config)
+        agent.host = self.hosts[name]
+        self.events.append(("state", name, True))
+
+    def drop_host(self, agent, now, error):
+        # Closed and forgotten, opened again when its agent reconnects
+        print(f"Ignored storage of host {agent.name} : {error}")
+        host = self.hosts.pop(agent.name, None)
+        if host is not None:
+            try:
+                host.close()
+            except OSError as e:
+                print(f"Ignored closing of host {agent.name} : {e}")
+        self.disconnect(agent, now, None)
+
+    def disconnect(self, agent, now, reason):
+        if agent.sock is not None:
+            try:
+                self.selector.unregister(agent.sock)
+            except (KeyError, ValueError):
+                pass
+            agent.sock.close()
+        if agent.host is not None:
+            self.events.append(("state", agent.name, False))
+        if reason is not None and agent.retry_delay == MIN_RETRY_DELAY:
+            print(f"Agent {agent.address} unreachable : {reason}")
+        agent.sock = None
+        agent.host = None
+        agent.buffer = b""
+        agent.headers_read = False
+        agent.next_attempt = now + agent.retry_delay
+        agent.retry_delay = min(agent.retry_delay * 2, MAX_RETRY_DELAY)
+
+    def stop(self):
+        self.stopping = True
+        if self.thread.is_alive():
+            self.thread.join()
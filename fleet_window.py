@@ -0,0 +1,124 @@
+import math
+import os
+import sys
+import time
+from PySide6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QComboBox, QTableWidget, QTableWidgetItem, QHeaderView)
+from PySide6.QtGui import QIcon
+from PySide6.QtCore import QTimer
+from fleet import FleetCollector, FLEET_DIR, host_id, worst
+from monitor import load_config
+
+COLUMNS = ["Host", "Status", "CPU (%)", "RAM (%)", "Temperature (°C)", "Disk used (%)", "Last sample"]
+# Sort choices, worst first
+SORTS = [
+    ("Worst metric", worst),
+    ("CPU", lambda latest: latest.get("cpu", 0)),
+    ("RAM", lambda latest: latest.get("ram", 0)),
+    ("Temperature", lambda latest: latest.get("temp", 0)),
+    ("Disk", lambda latest: latest.get("disk_percent", 0)),
+]
+
+
+class FleetWindow(QMainWindow):
+    # Every agent of fleet_agents on one table, the worst hosts on top.
+    # A double click opens the Statistics window of a host.
+    def __init__(self, config):
+        super().__init__()
+        self.setWindowTitle("Fleet")
+        self.setWindowIcon(QIcon("sentinelle.png"))
+        self.setGeometry(100, 100, 900, 600)
+
+        layout = QVBoxLayout()
+        sort_layout = QHBoxLayout()
+        sort_layout.addWidget(QLabel("Sort by:"))
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems([name for name, _ in SORTS])
+        self.sort_combo.currentIndexChanged.connect(self.refresh_table)
+        sort_layout.addWidget(self.sort_combo)
+        sort_layout.addStretch()
+        layout.addLayout(sort_layout)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.cellDoubleClicked.connect(self.open_host)
+        layout.addWidget(self.table)
+
+        central_widget = QWidget()
+        central_widget.setLayout(layout)
+        self.setCentralWidget(central_widget)
+
+        # Latest values and connection state of each host
+        self.latest = {}
+        self.connected = {}
+        self.stats_windows = {}
+
+        self.collector = FleetCollector(config)
+        self.collector.start()
+        self.update_timer = QTimer()
+        self.update_timer.timeout.connect(self.refresh)
+        self.update_timer.start(1000)
+
+    def refresh(self):
+        for kind, host, value in self.collector.drain():
+            if kind == "state":
+                self.connected[host] = value
+                self.latest.setdefault(host, {})
+                continue
+            self.latest.setdefault(host, {}).update(value)
+        self.refresh_table()
+
+    def refresh_table(self):
+        _, key = SORTS[self.sort_combo.currentIndex()]
+        hosts = sorted(self.latest, key=lambda host: key(self.latest[host]), reverse=True)
+        self.table.setRowCount(len(hosts))
+        for row, host in enumerate(hosts):
+            latest = self.latest[host]
+            timestamp = latest.get("timestamp")
+            cells = [
+                host,
+                "Connected" if self.connected.get(host) else "Disconnected",
+                self.format_value(latest.get("cpu")),
+                self.format_value(latest.get("ram")),
+                self.format_value(latest.get("temp")),
+                self.format_value(latest.get("disk_percent")),
+                time.strftime("%H:%M:%S", time.localtime(timestamp)) if timestamp else "",
+            ]
+            for column, text in enumerate(cells):
+                item = self.table.item(row, column)
+                if item is None:
+                    self.table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+
+    def format_value(self, value):
+        if not isinstance(value, (int, float)) or math.isnan(value):
+            return ""
+        return f"{value:.1f}"
+
+    def open_host(self, row, column):
+        # The window maps the column files the collector writes for the host
+        from stats_window import StatsWindow
+        host = self.table.item(row, 0).text()
+        if host not in self.stats_windows:
+            self.stats_windows[host] = StatsWindow(os.path.join(FLEET_DIR, host_id(host)), f"Statistics of {host}", build_columns=True)
+        window = self.stats_windows[host]
+        window.show()
+        window.raise_()
+
+    def closeEvent(self, event):
+        self.update_timer.stop()
+        self.collector.stop()
+        for window in self.stats_windows.values():
+            window.close()
+        event.accept()
+
+
+def run_fleet():
+    app = QApplication(sys.argv)
+    window = FleetWindow(load_config())
+    window.show()
+    return app.exec()
@@ -0,0 +1,213 @@
+import fnmatch
+import math
+import operator
+from alert_rules import AlertRule, configured_rules, FIRING, RESOLVED
+
+# Trends of the disk, RAM and temperature series: an exponentially weighted
+# linear regression per metric, updated in O(1) per sample, gives the current
+# level and slope. A forecast fires when the threshold of an alert rule will
+# be reached within the horizon of its family at the current slope.
+
+# family: (half life of the regression, default horizon, unit, rate period, rate period name).
+# A disk fills over hours, a temperature climbs in minutes.
+FAMILIES = {
+    "disk": (3600, 6 * 3600, "Go", 3600, "h"),
+    "ram": (600, 1800, "%", 60, "min"),
+    "temp": (120, 600, "°C", 60, "min"),
+}
+# The disk and temp aliases repeat disk.root and the hottest sensor
+DEFAULT_FORECAST_METRICS = ["disk.*", "ram", "temp.*"]
+# Before this many samples over a quarter of the half life the slope is noise
+MIN_SAMPLES = 5
+MIN_SPAN_FRACTION = 0.25
+# Share of the variance the line must explain (r²) for its slope to be trusted
+MIN_FIT = 0.3
+# A firing forecast resolves once the time to threshold is this much above the horizon
+RESOLVE_FACTOR = 1.5
+
+
+def format_eta(seconds):
+    if seconds < 90:
+        return f"~{seconds:.0f} s"
+    if seconds < 90 * 60:
+        return f"~{seconds / 60:.0f} min"
+    if seconds < 48 * 3600:
+        return f"~{seconds / 3600:.0f} h"
+    return f"~{seconds / 86400:.1f} d"
+
+
+class Trend:
+    # Weighted least squares of value against time, the weights decaying by
+    # half every half_life. The sums are kept with the last sample at t = 0:
+    # a new sample shifts them to its own time, then decays them, O(1).
+    __slots__ = ("half_life", "decay", "last", "first", "samples", "w", "t", "y", "tt", "ty", "yy")
+
+    def __init__(self, half_life):
+        self.half_life = half_life
+        self.decay = math.log(2) / half_life
+        self.reset()
+
+    def reset(self):
+        self.last = None
+        self.first = None
+        self.samples = 0
+        self.w = self.t = self.y = self.tt = self.ty = self.yy = 0.0
+
+    def add(self, timestamp, value):
+        weight = 1.0
+        if self.last is not None:
+            gap = timestamp - self.last
+            if gap <= 0:
+                return
+            # The sampling stopped: the old trend says nothing about this one
+            if gap > 4 * self.half_life:
+                self.reset()
+            else:
+                # Each value stands for the time before it, like in the rollups
+                weight = min(gap, self.half_life)
+                self.tt += -2 * gap * self.t + gap * gap * self.w
+                self.ty -= gap * self.y
+                self.t -= gap * self.w
+                factor = math.exp(-self.decay * gap)
+                self.w *= factor
+                self.t *= factor
+                self.y *= factor
+                self.tt *= factor
+                self.ty *= factor
+                self.yy *= factor
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        self.samples += 1
+        self.w += weight
+        self.y += weight * value
+        self.yy += weight * value * value
+
+    def fit(self):
+        # (level now, slope per second) or None while the trend is not reliable
+        if self.samples < MIN_SAMPLES or self.last - self.first < self.half_life * MIN_SPAN_FRACTION:
+            return None
+        time_variance = self.w * self.tt - self.t * self.t
+        value_variance = self.w * self.yy - self.y * self.y
+        if time_variance <= 0:
+            return None
+        covariance = self.w * self.ty - self.t * self.y
+        slope = covariance / time_variance
+        if value_variance <= 0 or covariance * covariance / (time_variance * value_variance) < MIN_FIT:
+            return None
+        return (self.y - slope * self.t) / self.w, slope
+
+
+class Forecast:
+    # One threshold of one metric, firing while it will be crossed within the horizon
+    def __init__(self, metric, family, rule, horizon):
+        self.metric = metric
+        self.family = family
+        self.above = rule.compare in (operator.gt, operator.ge)
+        self.threshold = rule.threshold
+        self.horizon = horizon
+        self.firing = False
+        self.level = None
+        self.slope = None
+        self.eta = None
+
+    def update(self, level, slope):
+        # FIRING or RESOLVED on a transition, None otherwise
+        self.level = level
+        self.slope = slope
+        margin = (self.threshold - level) if self.above else (level - self.threshold)
+        toward = slope if self.above else -slope
+        self.eta = margin / toward if margin > 0 and toward > 0 else None
+        # Already past the threshold: the alert rule itself takes over
+        if margin <= 0:
+            self.firing = False
+            return None
+        if not self.firing and self.eta is not None and self.eta <= self.horizon:
+            self.firing = True
+            return FIRING
+        if self.firing and (self.eta is None or self.eta > self.horizon * RESOLVE_FACTOR):
+            self.firing = False
+            return RESOLVED
+        return None
+
+    def describe(self):
+        _, _, unit, period, period_name = FAMILIES[self.family]
+        rate = abs(self.slope) * period
+        direction = "rising" if self.slope > 0 else "falling"
+        if self.family == "disk":
+            text = f"{self.metric} {direction} {rate:.2f} {unit}/{period_name}"
+            if self.slope < 0 and self.level > 0:
+                text += f", full in {format_eta(self.level / -self.slope)}"
+        else:
+            text = f"{self.metric} {direction} {rate:.1f} {unit}/{period_name}"
+        if self.eta is not None:
+            text += f", {self.threshold:g} {unit} in {format_eta(self.eta)}"
+        return text
+
+
+class Forecaster:
+    # Trends of the forecast metrics and the forecasts of their alert rules.
+    # The thresholds are those of the rules: a rule naming the metric wins
+    # over a pattern like in the alert engine, then come the rules of the
+    # family alias. A metric without a rule still has its trend for estimates().
+    def __init__(self, config):
+        self.patterns = config.get("forecast_metrics", DEFAULT_FORECAST_METRICS)
+        self.horizons = {family: horizon for family, (_, horizon, _, _, _) in FAMILIES.items()}
+        self.horizons.update(config.get("forecast_horizons", {}))
+        self.rules = []
+        for text in configured_rules(config):
+            try:
+                self.rules.append(AlertRule(text))
+            except ValueError:
+                # Reported by the alert engine
+                continue
+        # metric -> (Trend, [Forecast]), None for the metrics not forecast
+        self.metrics = {}
+
+    def watch(self, metric):
+        family = metric.split(".")[0]
+        if family not in FAMILIES or not any(fnmatch.fnmatchcase(metric, pattern) for pattern in self.patterns):
+            return None
+        rules = [rule for rule in self.rules if rule.metric == metric]
+        if not rules:
+            rules = [rule for rule in self.rules if fnmatch.fnmatchcase(metric, rule.metric)]
+        if not rules:
+            # temp > 90 is on the hottest sensor, so it holds for each of them
+            rules = [rule for rule in self.rules if rule.metric == family]
+        horizon = self.horizons[family]
+        return Trend(FAMILIES[family][0]), [Forecast(metric, family, rule, horizon) for rule in rules]
+
+    def update(self, timestamp, stats):
+        # [(forecast, FIRING or RESOLVED)] for this sample
+        events = []
+        for metric, value in stats.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or math.isnan(value):
+                continue
+            watched = self.metrics.get(metric, False)
+            if watched is False:
+                watched = self.metrics[metric] = self.watch(metric)
+            if watched is None:
+                continue
+            trend, forecasts = watched
+            trend.add(timestamp, value)
+            fit = trend.fit()
+            # An unreliable trend leaves the forecasts as they were
+            if fit is None:
+                continue
+            for forecast in forecasts:
+                event = forecast.update(*fit)
+                if event:
+                    events.append((forecast, event))
+        return events
+
+    def firing(self):
+        return [forecast for _, forecasts in filter(None, self.metrics.values()) for forecast in forecasts if forecast.firing]
+
+    def estimates(self):
+        # {metric: (level, slope per second)} of the trends that are reliable now
+        estimates = {}
+        for metric, watched in self.metrics.items():
+            fit = watched[0].fit() if watched else None
+            if fit:
+                estimates[metric] = fit
+        return estimates
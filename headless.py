@@ -0,0 +1,59 @@
+import signal
+import sys
+import time
+from collector import SystemCollector
+from monitor import Monitor, load_config, open_storage
+from metrics_server import open_server
+
+# Seconds between two prunings of the history past retention
+PRUNE_INTERVAL = 10 * 60
+
+
+def log_alert(title, message):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {title}: {message}", flush=True)
+
+
+def stop(signum, frame):
+    raise SystemExit(0)
+
+
+def run_headless():
+    # Monitoring and alerting loop without any display, Qt is never imported
+    config = load_config()
+    storage, downsampler = open_storage(config)
+    monitor = Monitor(config, storage, downsampler, log_alert)
+    collector = SystemCollector(config)
+    server = open_server(config)
+
+    signal.signal(signal.SIGTERM, stop)
+    next_prune = time.monotonic() + PRUNE_INTERVAL
+    try:
+        while True:
+            snapshot = collector.collect_due()
+            if snapshot["fresh"]:
+                stats = monitor.process(snapshot)
+                if server:
+                    server.publish(snapshot, stats)
+
+            now = time.monotonic()
+            if now >= next_prune:
+                monitor.prune()
+                next_prune = now + PRUNE_INTERVAL
+
+            # Sleep until the next source is due, or a PSI trigger fires
+            delay = min(collector.next_due(), next_prune) - time.monotonic()
+            if delay > 0:
+                for trigger in collector.triggers.wait(delay):
+                    monitor.stall(trigger.text)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.close()
+        collector.close()
+        monitor.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_headless())
@@ -0,0 +1,230 @@
+import sys
+import subprocess
+import json
+from PySide6.QtWidgets import (QApplication, QMainWindow, QPushButton, QHBoxLayout, QVBoxLayout, QWidget, QSystemTrayIcon, QMenu, QLabel)
+from PySide6.QtGui import QIcon, QPixmap
+from PySide6.QtCore import QTimer
+from sampler import Sampler
+from monitor import Monitor, CONFIG_FILE, load_config, open_storage
+from metrics_server import open_server
+
+class SentinelApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Programme Sentinelle")
+        self.setWindowIcon(QIcon("sentinelle.png"))
+        self.load_config()
+        self.storage, self.downsampler = open_storage(self.config)
+        # Opened on the first click, shown again on the next ones
+        self.stats_window = None
+
+        # main Layout
+        layout = QVBoxLayout()
+
+        self.image_label = QLabel(self)
+        pixmap = QPixmap("sentinelle.png")
+        scaled_pixmap = pixmap.scaled(pixmap.width() // 12, pixmap.height() // 12)
+        self.image_label.setPixmap(scaled_pixmap)
+
+        image_layout = QHBoxLayout()
+        image_layout.addStretch()
+        image_layout.addWidget(self.image_label)
+        image_layout.addStretch()
+
+        layout.addLayout(image_layout)
+
+        # buttons for enable/disable tactile screen
+        self.touch_disable_button = QPushButton("Disable the touch screen")
+        self.touch_enable_button = QPushButton("Enable the touch screen")
+        layout.addWidget(self.touch_disable_button)
+        layout.addWidget(self.touch_enable_button)
+
+        # Connect the buttons to their
+        self.touch_disable_button.clicked.connect(self.disable_touchscreen)
+        self.touch_enable_button.clicked.connect(self.enable_touchscreen)
+
+        # Button for open the Boot menu
+        start_button = QPushButton("Boot menu")
+        start_button.clicked.connect(self.open_start_window)
+        layout.addWidget(start_button)
+
+        # Button for open the stttings window
+        config_button = QPushButton("Settings")
+        config_button.clicked.connect(self.open_config_window)
+        layout.addWidget(config_button)
+
+        # Button for open the stats menu
+        stats_button = QPushButton("Statistics")
+        stats_button.clicked.connect(self.open_stats_window)
+        layout.addWidget(stats_button)
+
+        # Button for open the current informations window
+        current_info_button = QPushButton("current informations")
+        current_info_button.clicked.connect(self.open_current_info_window)
+        layout.addWidget(current_info_button)
+
+        # Button for open the diagnostics of Sentinelle itself
+        diagnostics_button = QPushButton("Diagnostics")
+        diagnostics_button.clicked.connect(self.open_diagnostics_window)
+        layout.addWidget(diagnostics_button)
+
+        self.grise = QLabel("Dev by Grise")
+        layout.addWidget(self.grise)
+
+        # Central widget
+        central_widget = QWidget()
+        central_widget.setLayout(layout)
+        self.setCentralWidget(central_widget)
+
+        # Initialize taskbar icon
+        self.tray_icon = QSystemTrayIcon(self)
+        self.tray_icon.setIcon(QIcon("sentinelle.png"))
+
+        # Taskbar menu
+        tray_menu = QMenu()
+        show_action = tray_menu.addAction("Show")
+        show_action.triggered.connect(self.show)
+        exit_action = tray_menu.addAction("Exit")
+        exit_action.triggered.connect(self.exit_app)
+        self.tray_icon.setContextMenu(tray_menu)
+
+        # Show the icon in the taskbar
+        self.tray_icon.show()
+
+        # Threshold checks and stats writing, the alerts go to the taskbar icon
+        self.monitor = Monitor(self.config, self.storage, self.downsampler, self.notify)
+
+        # Sampler thread for the systeme monitoring, shared with the real time window
+        self.sampler = Sampler(self.config)
+        self.sampler.snapshot_ready.connect(self.monitor_system)
+        self.sampler.stall.connect(self.monitor.stall)
+        self.server = open_server(self.config)
+        self.started_server_settings = self.server_settings()
+        self.sampler.start()
+
+        # Timer for dropping the history older than the retention of each tier
+        self.prune_timer = QTimer()
+        self.prune_timer.timeout.connect(self.prune_history)
+        self.prune_timer.start(10 * 60 * 1000)
+
+    def open_pie_chart_window(self):
+        self.pie_chart_window = PieChartWindow()
+        self.pie_chart_window.show()
+
+    def disable_touchscreen(self):
+        if sys.platform == "linux":
+            subprocess.run("xinput disable 9", shell=True)
+        elif sys.platform == "win32":
+            # specific command of windows for disable the touchscreen
+            subprocess.run('powershell.exe -Command "Get-PnpDevice | Where-Object { $_.FriendlyName -match \'Touchscreen\' } | Disable-PnpDevice -Confirm:$false"', shell=True)
+
+    def enable_touchscreen(self):
+        if sys.platform == "linux":
+            subprocess.run("xinput enable 9", shell=True)
+        elif sys.platform == "win32":
+            # Cspecific command of windows for enable touchscreen
+            subprocess.run('powershell.exe -Command "Get-PnpDevice | Where-Object { $_.FriendlyName -match \'Touchscreen\' } | Enable-PnpDevice -Confirm:$false"', shell=True)
+
+    def execute_command(self, command):
+        # power off
+        if command == "shutdown":
+            if sys.platform == "linux":
+                subprocess.run("shutdown now", shell=True)
+            elif sys.platform == "win32":
+                subprocess.run("shutdown /s /t 0", shell=True)
+        # reboot
+        elif command == "reboot":
+            if sys.platform == "linux":
+                subprocess.run("reboot", shell=True)
+            elif sys.platform == "win32":
+                subprocess.run("shutdown /r /t 0", shell=True)
+        # sleep
+        elif command == "sleep":
+            if sys.platform == "linux":
+                subprocess.run("systemctl suspend", shell=True)
+            elif sys.platform == "win32":
+                subprocess.run("rundll32.exe powrprof.dll,SetSuspendState 0,1,0", shell=True)
+
+    # The windows are imported on their first opening, QtCharts included
+    def open_config_window(self):
+        from config_window import ConfigWindow
+        self.config_window = ConfigWindow(self.config, self.save_config)
+        self.config_window.show()
+
+    def open_start_window(self):
+        from start_menu import StartMenu
+        self.start_window = StartMenu()
+        self.start_window.show()
+
+    def open_stats_window(self):
+        from stats_window import StatsWindow
+        if self.stats_window is None:
+            self.stats_window = StatsWindow()
+        self.stats_window.show()
+        self.stats_window.raise_()
+        self.stats_window.activateWindow()
+
+    def open_current_info_window(self):
+        from current_info_window import CurrentInfoWindow
+        self.ring_stats_window = CurrentInfoWindow(self.sampler)
+        self.ring_stats_window.show()
+
+    def open_diagnostics_window(self):
+        from diagnostics_window import DiagnosticsWindow
+        self.diagnostics_window = DiagnosticsWindow(self.sampler)
+        self.diagnostics_window.show()
+
+    def load_config(self):
+        self.config = load_config()
+
+    def save_config(self, config):
+        self.config = config
+        self.monitor.set_config(config)
+        with open(CONFIG_FILE, 'w') as file:
+            json.dump(self.config, file)
+        self.sampler.set_config(self.config)
+        # The settings window edits the config in place, compare with what the server was started with
+        if self.server_settings() != self.started_server_settings:
+            if self.server:
+                self.server.close()
+            self.server = open_server(self.config)
+            self.started_server_settings = self.server_settings()
+
+    def server_settings(self):
+        return (self.config.get("server_enabled", False), self.config.get("server_address"))
+
+    def notify(self, title, message):
+        self.tray_icon.showMessage(title, message, QSystemTrayIcon.Warning)
+
+    def monitor_system(self, snapshot):
+        stats = self.monitor.process(snapshot)
+        if self.server:
+            self.server.publish(snapshot, stats)
+
+    def prune_history(self):
+        self.monitor.prune()
+
+    def exit_app(self):
+        self.sampler.stop()
+        if self.server:
+            self.server.close()
+        self.monitor.close()
+        self.tray_icon.hide()
+        QApplication.quit()
+
+    def closeEvent(self, event):
+        event.ignore()
+        self.hide()
+        self.tray_icon.showMessage(
+            "Programme Sentinelle",
+            "The application continues to run in the background. Click the taskbar icon to reopen it",
+            QSystemTrayIcon.Information,
+            2000
+        )
+
+
+def run_gui():
+    app = QApplication(sys.argv)
+    window = SentinelApp()
+    window.show()
+    return app.exec()
@@ -0,0 +1,407 @@
+import os
+import re
+import psutil
+from sensors import SensorRegistry
+from processes import ProcessTracker
+from rates import RateCounter
+from mounts import MountTable, UsageReader
+from psi import PressureReader
+from cgroups import CgroupRegistry, cgroup_id, parse_keyed, parse_io, DEFAULT_CGROUP_DEPTH, DEFAULT_MAX_CGROUPS
+from diagnostics import diagnostics
+
+# A metric source reads one part of the system. It declares how often it wants
+# to run (interval, in seconds) and how much a run costs (cost, relative, the
+# cheap sources run first when several are due), and the metrics it charts as
+# {metric: (title, y label)}. collect() returns {metric: value}.
+#
+# Adding a metric is writing a source and adding it to SOURCES: the scheduler,
+# the storage, the alert rules, the Statistics window and the settings window
+# pick it up from there.
+
+# Bridges, veth and tun interfaces, device mapper and md arrays: their traffic
+# is already counted on the devices under them
+VIRTUAL_DEVICES = '/sys/devices/virtual/'
+
+
+def is_virtual(path):
+    return os.path.realpath(path).startswith(VIRTUAL_DEVICES)
+
+
+class MetricSource:
+    name = ""
+    label = ""
+    cost = 1
+    default_interval = None
+    metrics = {}
+
+    def __init__(self, config):
+        # Interval from the settings, the check interval unless the source wants another default
+        check_interval = config.get("check_interval", 5)
+        intervals = config.get("source_intervals", {})
+        self.interval = intervals.get(self.name, max(check_interval, self.default_interval or 0))
+
+    def collect(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class CpuSource(MetricSource):
+    name = "cpu"
+    label = "CPU usage"
+    metrics = {"cpu": ("CPU", "CPU utilisation(%)")}
+
+    def __init__(self, config):
+        super().__init__(config)
+        # The first cpu_percent() call has no reference and always returns 0.0.
+        # It measures since its previous call from anywhere in the process, so
+        # this source must be its only caller.
+        psutil.cpu_percent()
+
+    def collect(self):
+        return {"cpu": psutil.cpu_percent()}
+
+
+class RamSource(MetricSource):
+    name = "ram"
+    label = "RAM usage"
+    metrics = {"ram": ("RAM", "RAM utilisation(%)")}
+
+    def collect(self):
+        return {"ram": psutil.virtual_memory().percent}
+
+
+class TemperatureSource(MetricSource):
+    name = "temp"
+    label = "the temperature"
+    cost = 2
+    metrics = {"temp": ("Temperature", "Temperature")}
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.sensors = SensorRegistry(config.get("temp_sensors"), config.get("temp_rescan_interval", 60))
+
+    def collect(self):
+        # Every selected sensor under temp.<sensor id>, and the hottest one under temp
+        values = {}
+        temperatures = self.sensors.read()
+        for identifier, temp in temperatures.items():
+            values[f"temp.{identifier}"] = temp
+        if temperatures:
+            values["temp"] = max(temperatures.values())
+        return values
+
+    def close(self):
+        self.sensors.close()
+
+
+class DiskSource(MetricSource):
+    name = "disk"
+    label = "free space disk"
+    cost = 2
+    # Free space moves slowly
+    default_interval = 30
+    metrics = {"disk": ("Disk", "Free space disk (Go)")}
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.mounts = MountTable(config.get("disk_exclude_fstypes"), config.get("disk_rescan_interval", 60))
+        self.usage = UsageReader(config.get("disk_timeout", 2))
+
+    def collect(self):
+        # Every mount under disk.<mount id>, and / under disk as before
+        values = {}
+        for identifier, disk in self.usage.read(self.mounts.read()).items():
+            values[f"disk.{identifier}"] = disk.free / (1024 * 1024 * 1024)
+            values[f"disk_percent.{identifier}"] = disk.percent
+        if "disk.root" in values:
+            values["disk"] = values["disk.root"]
+            values["disk_percent"] = values["disk_percent.root"]
+        return values
+
+    def close(self):
+        self.mounts.close()
+
+
+class ProcessSource(MetricSource):
+    name = "processes"
+    label = "the top processes"
+    cost = 5
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.tracker = ProcessTracker(config.get("top_processes", 5), config.get("process_rescan_interval", 30))
+
+    def collect(self):
+        return {"top_processes": self.tracker.sample()}
+
+
+class CpuCoresSource(MetricSource):
+    name = "cpu_cores"
+    label = "each CPU core"
+    metrics = {"cpu_max_core": ("Busiest core", "CPU utilisation(%)")}
+
+    def __init__(self, config):
+        super().__init__(config)
+        # Per core readings have their own reference in psutil, apart from cpu_percent()
+        psutil.cpu_percent(percpu=True)
+
+    def collect(self):
+        cores = psutil.cpu_percent(percpu=True)
+        values = {f"cpu.core{index}": value for index, value in enumerate(cores)}
+        if cores:
+            values["cpu_max_core"] = max(cores)
+        return values
+
+
+class DiskIoSource(MetricSource):
+    name = "disk_io"
+    label = "disk I/O"
+    cost = 2
+    metrics = {
+        "disk_read": ("Disk read", "Bytes/s"),
+        "disk_write": ("Disk write", "Bytes/s"),
+    }
+    # Partitions are counted in their disk, loop and ram devices are left out
+    IGNORED = re.compile(r'^(loop|ram|zram)\d+$|^(sd[a-z]+|hd[a-z]+|vd[a-z]+|xvd[a-z]+)\d+$|^(nvme\d+n\d+|mmcblk\d+)p\d+$')
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.counters = RateCounter()
+        # disk -> virtual, looked up once
+        self.virtual = {}
+
+    def collect(self):
+        counters = {}
+        for disk, io in (psutil.disk_io_counters(perdisk=True) or {}).items():
+            if self.IGNORED.match(disk):
+                continue
+            counters[(disk, "read")] = io.read_bytes
+            counters[(disk, "write")] = io.write_bytes
+            if hasattr(io, "busy_time"):
+                counters[(disk, "busy")] = io.busy_time
+        values = {"disk_read": 0.0, "disk_write": 0.0}
+        rates = self.counters.update(counters)
+        if not rates:
+            return {}
+        for (disk, kind), rate in rates.items():
+            if kind == "busy":
+                # Milliseconds busy per second, as a percentage
+                values[f"disk_io.{disk}.busy"] = min(rate / 10, 100)
+                continue
+            values[f"disk_io.{disk}.{kind}"] = rate
+            if disk not in self.virtual:
+                self.virtual[disk] = is_virtual(f"/sys/block/{disk}")
+            # A dm or md device only on its own, the totals have its member disks
+            if not self.virtual[disk]:
+                values[f"disk_{kind}"] += rate
+        return values
+
+
+class NetSource(MetricSource):
+    name = "net"
+    label = "the network"
+    cost = 2
+    metrics = {
+        "net_recv": ("Network received", "Bytes/s"),
+        "net_sent": ("Network sent", "Bytes/s"),
+    }
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.counters = RateCounter()
+        # nic -> virtual, looked up once
+        self.virtual = {}
+
+    def collect(self):
+        counters = {}
+        for nic, io in psutil.net_io_counters(pernic=True).items():
+            if nic == "lo":
+                continue
+            counters[(nic, "recv")] = io.bytes_recv
+            counters[(nic, "sent")] = io.bytes_sent
+        values = {"net_recv": 0.0, "net_sent": 0.0}
+        rates = self.counters.update(counters)
+        if not rates:
+            return {}
+        for (nic, kind), rate in rates.items():
+            values[f"net.{nic}.{kind}"] = rate
+            if nic not in self.virtual:
+                self.virtual[nic] = is_virtual(f"/sys/class/net/{nic}")
+            # A bridge, veth or docker0 only on its own, the totals have the physical interfaces
+            if not self.virtual[nic]:
+                values[f"net_{kind}"] += rate
+        return values
+
+
+class SwapSource(MetricSource):
+    name = "swap"
+    label = "the swap"
+    metrics = {"swap": ("Swap", "Swap utilisation(%)")}
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.counters = RateCounter()
+
+    def collect(self):
+        swap = psutil.swap_memory()
+        values = {"swap": swap.percent}
+        # Pages swapped in and out, in bytes per second
+        rates = self.counters.update({"swap_in": swap.sin, "swap_out": swap.sout})
+        values.update(rates)
+        return values
+
+
+class LoadSource(MetricSource):
+    name = "load"
+    label = "the load average"
+    metrics = {"load1": ("Load average", "Load (1 min)")}
+
+    def collect(self):
+        load1, load5, load15 = psutil.getloadavg()
+        return {"load1": load1, "load5": load5, "load15": load15}
+
+
+class CgroupSource(MetricSource):
+    name = "cgroups"
+    label = "the cgroups (containers, slices)"
+    cost = 3
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.cgroups = CgroupRegistry(config.get("cgroups"), config.get("cgroup_rescan_interval", 60),
+                                      depth=config.get("cgroup_depth", DEFAULT_CGROUP_DEPTH),
+                                      limit=config.get("max_cgroups", DEFAULT_MAX_CGROUPS))
+        self.counters = RateCounter()
+
+    def collect(self):
+        # cgroup.<id>.cpu in % of one core, .throttled in % of the time,
+        # .memory in Mo, .memory_percent of memory.max, .io_read and .io_write in bytes/s
+        values = {}
+        counters = {}
+        for path, files in self.cgroups.read().items():
+            prefix = f"cgroup.{cgroup_id(path)}"
+            cpu = parse_keyed(files.get("cpu.stat", ""))
+            if "usage_usec" in cpu:
+                counters[(prefix, "cpu")] = cpu["usage_usec"]
+            if "throttled_usec" in cpu:
+                counters[(prefix, "throttled")] = cpu["throttled_usec"]
+            io = parse_io(files.get("io.stat", ""))
+            if io:
+                counters[(prefix, "io_read")] = io.get("rbytes", 0)
+                counters[(prefix, "io_write")] = io.get("wbytes", 0)
+            current = files.get("memory.current", "").strip()
+            if current.isdigit():
+                values[f"{prefix}.memory"] = int(current) / (1024 * 1024)
+                limit = files.get("memory.max", "").strip()
+                if limit.isdigit() and int(limit):
+                    values[f"{prefix}.memory_percent"] = int(current) / int(limit) * 100
+        for (prefix, kind), rate in self.counters.update(counters).items():
+            # Microseconds per second, as a percentage
+            values[f"{prefix}.{kind}"] = rate / 10000 if kind in ("cpu", "throttled") else rate
+        return values
+
+    def close(self):
+        self.cgroups.close()
+
+
+class PressureSource(MetricSource):
+    name = "psi"
+    label = "the pressure stalls (PSI)"
+    metrics = {
+        "psi.cpu.some.avg10": ("CPU pressure", "Stalled time (%)"),
+        "psi.memory.some.avg10": ("Memory pressure", "Stalled time (%)"),
+        "psi.io.some.avg10": ("I/O pressure", "Stalled time (%)"),
+    }
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.pressure = PressureReader()
+        self.counters = RateCounter()
+
+    def collect(self):
+        # psi.<resource>.<some|full>.avg10 and .avg60 from the kernel, and under
+        # psi.<resource>.<some|full> the stalled time since the previous read
+        values = {}
+        counters = {}
+        for resource, pressure in self.pressure.read().items():
+            for kind, fields in pressure.items():
+                prefix = f"psi.{resource}.{kind}"
+                values[f"{prefix}.avg10"] = fields.get("avg10", 0.0)
+                values[f"{prefix}.avg60"] = fields.get("avg60", 0.0)
+                counters[prefix] = fields.get("total", 0)
+        for prefix, rate in self.counters.update(counters).items():
+            # Microseconds per second, as a percentage
+            values[prefix] = rate / 10000
+        return values
+
+    def close(self):
+        self.pressure.close()
+
+
+class SelfSource(MetricSource):
+    name = "self"
+    label = "Sentinelle itself (diagnostics)"
+    metrics = {
+        "self.cpu": ("Sentinelle CPU", "CPU utilisation(%)"),
+        "self.rss": ("Sentinelle memory", "RSS (Mo)"),
+    }
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.process = psutil.Process()
+        self.process.cpu_percent()
+        self.counters = RateCounter()
+        self.last_tick = (0, 0.0)
+        self.last_counts = {}
+        # The instrumentation of the hot paths runs while this source exists
+        diagnostics.enable(True)
+
+    def collect(self):
+        # self.cpu in % of one core, self.rss in Mo, self.io_read and .io_write in
+        # bytes/s, self.tick_ms the mean monitor tick since the previous read,
+        # self.late and self.missed the source runs late or skipped since then
+        with self.process.oneshot():
+            values = {
+                "self.cpu": self.process.cpu_percent(),
+                "self.rss": self.process.memory_info().rss / (1024 * 1024),
+                "self.threads": self.process.num_threads(),
+            }
+            counters = {}
+            try:
+                io = self.process.io_counters()
+                counters = {"self.io_read": io.read_bytes, "self.io_write": io.write_bytes}
+            except (AttributeError, psutil.Error):
+                # Not available on macOS
+                pass
+        values.update(self.counters.update(counters))
+
+        tick = diagnostics.histogram("tick")
+        count, total = self.last_tick
+        if tick.count > count:
+            values["self.tick_ms"] = (tick.total - total) / (tick.count - count) * 1000
+        self.last_tick = (tick.count, tick.total)
+        for name, metric in (("late_runs", "self.late"), ("missed_runs", "self.missed")):
+            current = diagnostics.counters.get(name, 0)
+            values[metric] = current - self.last_counts.get(name, 0)
+            self.last_counts[name] = current
+        return values
+
+    def close(self):
+        diagnostics.enable(False)
+
+
+SOURCES = [CpuSource, RamSource, TemperatureSource, DiskSource, ProcessSource,
+           CpuCoresSource, DiskIoSource, NetSource, SwapSource, LoadSource, CgroupSource, PressureSource,
+           SelfSource]
+
+
+def create_sources(config):
+    # The enabled sources, monitor_<name> in the settings
+    return [source(config) for source in SOURCES if config.get(f"monitor_{source.name}", True)]
+
+
+def chart_metrics():
+    # [(metric, title, y label)] of every source
+    return [(metric, title, y_label) for source in SOURCES for metric, (title, y_label) in source.metrics.items()]
@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import re
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from stats_storage import STATS_DIR
+from stats_columns import MappedHistory
+from stats_rollup import configured_tiers, choose_tier, tier_directory
+from diagnostics import diagnostics
+
+# Local endpoint for scrapers:
+#   GET /metrics                                 latest values, OpenMetrics text
+#   GET /api/query?metric=cpu&start=&end=&step=  stored history, JSON
+#   GET /stream                                  every stored sample as it comes, one JSON per line
+# Set server_address to "127.0.0.1:9790" or "unix:/run/sentinelle.sock".
+DEFAULT_ADDRESS = "127.0.0.1:9790"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Samples kept for a slow stream client, the oldest are dropped beyond
+STREAM_BUFFER = 600
+# Seconds without a sample after which the stream sends an empty line, so both ends see a dead peer
+STREAM_HEARTBEAT = 5
+
+
+def openmetrics(snapshot, extra=()):
+    # Every numeric metric as a gauge sentinelle_<name>, dots and dashes become _,
+    # then the extra lines (the diagnostics histograms)
+    lines = []
+    families = set()
+    timestamp = snapshot.get("timestamp", int(time.time()))
+    for metric, value in snapshot.items():
+        if metric == "timestamp" or isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            continue
+        family = "sentinelle_" + re.sub(r'[^a-zA-Z0-9_]', '_', metric)
+        if family in families:
+            continue
+        families.add(family)
+        lines.append(f"# TYPE {family} gauge")
+        lines.append(f"{family} {value!r} {timestamp}")
+    lines.extend(extra)
+    lines.append("# EOF\n")
+    return "\n".join(lines).encode()
+
+
+class StreamSubscriber:
+    # Lines waiting for one stream client. put() never blocks the sampling loop:
+    # when the client reads slower than the samples come, the oldest are dropped.
+    def __init__(self):
+        self.lines = deque(maxlen=STREAM_BUFFER)
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, line):
+        with self.condition:
+            self.lines.append(line)
+            self.condition.notify()
+
+    def get(self, timeout):
+        # Every waiting line, [] after timeout
+        with self.condition:
+            if not self.lines and not self.closed:
+                self.condition.wait(timeout)
+            lines = list(self.lines)
+            self.lines.clear()
+            return lines
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        metrics = self.server.metrics
+        if url.path == "/metrics":
+            self.reply(200, OPENMETRICS_TYPE, metrics.exposition)
+        elif url.path == "/api/query":
+            try:
+                body = metrics.query(parse_qs(url.query))
+            except ValueError as e:
+                self.reply(400, "application/json", json.dumps({"error": str(e)}).encode())
+                return
+            self.reply(200, "application/json", json.dumps(body).encode())
+        elif url.path == "/stream":
+            self.stream(metrics)
+        else:
+            self.reply(404, "text/plain", b"Not found\n")
+
+    def stream(self, metrics):
+        # A hello line with the host name, then the samples until the client leaves
+        subscriber = metrics.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            self.wfile.write(json.dumps({"host": socket.gethostname()}).encode() + b"\n")
+            while not subscriber.closed:
+                self.wfile.write(b"".join(subscriber.get(STREAM_HEARTBEAT)) or b"\n")
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            metrics.unsubscribe(subscriber)
+
+    def reply(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # A scrape every few seconds would flood the output
+        pass
+
+
+class MetricsServer:
+    # Threaded HTTP server on localhost or a Unix socket. publish() is called by
+    # the sampling loop; it renders the exposition once and swaps it in, so a
+    # scrape only reads an immutable bytes object and never waits for the
+    # sampler, the GUI or the disk. The range queries read the column files
+    # of the tiers, mapped in memory, that the storage keeps up to date.
+    def __init__(self, config):
+        self.exposition = b"# EOF\n"
+        self.tiers = configured_tiers(config)
+        # Mapped on the first query of each tier. The lock keeps two queries
+        # from refreshing the same history together.
+        self.lock = threading.Lock()
+        self.histories = {}
+        self.subscribers = set()
+
+        address = config.get("server_address", DEFAULT_ADDRESS)
+        if address.startswith("unix:"):
+            path = address[len("unix:"):]
+            if os.path.exists(path):
+                os.unlink(path)
+            self.server = UnixHTTPServer(path, MetricsRequestHandler)
+        else:
+            host, _, port = address.rpartition(":")
+            self.server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), MetricsRequestHandler)
+        self.server.metrics = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def publish(self, snapshot, stats):
+        # snapshot has the latest value of every metric, stats the stored sample
+        with diagnostics.timer("publish"):
+            self.exposition = openmetrics(snapshot, diagnostics.openmetrics() if diagnostics.enabled else ())
+        if self.subscribers:
+            line = json.dumps(stats).encode() + b"\n"
+            for subscriber in list(self.subscribers):
+                subscriber.put(line)
+
+    def subscribe(self):
+        subscriber = StreamSubscriber()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def history(self, tier):
+        if tier not in self.histories:
+            self.histories[tier] = MappedHistory(tier_directory(STATS_DIR, tier))
+        history = self.histories[tier]
+        history.refresh()
+        return history
+
+    def query(self, params):
+        # {"metric", "tier", "timestamps", "values"}, NaN as null. Without a
+        # step the finest tier covering start is used, with a step the coarsest
+        # one that has a sample per step.
+        if "metric" not in params:
+            raise ValueError("metric is required")
+        metric = params["metric"][0]
+        now = time.time()
+        end = float(params.get("end", [now])[0])
+        start = float(params.get("start", [end - 3600])[0])
+        step = float(params.get("step", [0])[0])
+        min_points = (end - start) / step if step > 0 else math.inf
+        tier = choose_tier(self.tiers, start, end, min_points)
+        with self.lock:
+            history = self.history(tier)
+            timestamps, values = history.query(metric, start, end, step or None)
+            timestamps = list(timestamps)
+            values = [None if math.isnan(value) else value for value in values]
+        return {"metric": metric, "tier": tier, "timestamps": timestamps, "values": values}
+
+    def close(self):
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.server, UnixHTTPServer):
+            try:
+                os.unlink(self.server.server_address)
+            except OSError:
+                pass
+
+
+def open_server(config):
+    # The server if server_enabled is set, None otherwise or if the address is taken
+    if not config.get("server_enabled", False):
+        return None
+    try:
+        return MetricsServer(config)
+    except (OSError, ValueError) as e:
+        print(f"Metrics server not started : {e}")
+        return None
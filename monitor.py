@@ -0,0 +1,162 @@
+import json
+import os
+import time
+from stats_storage import StatsStorage
+from stats_rollup import Downsampler, configured_tiers
+from alert_rules import AlertRuleEngine, configured_rules, FIRING
+from forecast import Forecaster
+from processes import format_top
+from diagnostics import diagnostics
+
+ALERT_TITLES = {
+    "cpu": "CPU Alert",
+    "ram": "RAM Alert",
+    "temp": "Temperature Alert",
+    "disk": "Disk Alerte",
+}
+
+FORECAST_TITLES = {
+    "disk": "Disk forecast",
+    "ram": "RAM forecast",
+    "temp": "Temperature forecast",
+}
+
+# Process ranking attached to the alerts of a metric
+ALERT_TOP_RANKINGS = {
+    "cpu": "cpu",
+    "ram": "rss",
+}
+
+CONFIG_FILE = 'sentinel_config.json'
+
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r') as file:
+            return json.load(file)
+    # Default value if the config file does  not exist
+    return {
+        "temperature_unit": "Celsius (°C)",
+        "cpu_usage_threshold": 90, # 90%
+        "ram_usage_threshold": 90, # 90%
+        "disk_space_threshold": 1, # one GO
+        "update_interval": 1, # one second
+        "notification_interval": 3600 # one hour
+    }
+
+
+def open_storage(config):
+    # Append only storage for the statistics history, and its rollup tiers
+    storage = StatsStorage(
+        segment_max_bytes=config.get("stats_segment_max_bytes", 4 * 1024 * 1024),
+        segment_max_age=config.get("stats_segment_max_age", 24 * 3600),
+        flush_interval=config.get("stats_flush_interval", 10),
+    )
+    downsampler = Downsampler(storage, configured_tiers(config), config.get("sketch_metrics"))
+    downsampler.prune()
+    return storage, downsampler
+
+
+class Monitor:
+    # Alert rules and stats writing for one snapshot, without any GUI.
+    # notify(title, message) receives the alerts: the tray icon in the GUI,
+    # the log in headless mode.
+    def __init__(self, config, storage, downsampler, notify):
+        self.storage = storage
+        self.downsampler = downsampler
+        self.notify = notify
+        # Last time notifications were sent, per rule
+        self.last_notification_times = {}
+        self.top_processes = None
+        self.top_processes_stored = None
+        self.set_config(config)
+
+    def set_config(self, config):
+        self.config = config
+        self.rules = AlertRuleEngine(configured_rules(config))
+        # Predictive alerts: the thresholds of the rules reached within the horizon at the current trend
+        self.forecaster = Forecaster(config) if config.get("forecast_alerts", True) else None
+        self.last_notification_times = {}
+
+    def alert(self, rule, resolved=False):
+        # disk.var is a Disk alert, temp.<sensor> a Temperature one
+        title = ALERT_TITLES.get(rule.metric.split(".")[0], f"{rule.metric} alert")
+        if resolved:
+            self.notify(f"{title} resolved", f"{rule.text} ({rule.value:.2f})")
+            self.last_notification_times.pop(rule, None)
+            return
+        # A firing rule is notified again every notification_interval
+        current_time = time.monotonic()
+        last_time = self.last_notification_times.get(rule)
+        if last_time is None or current_time - last_time >= self.config.get("notification_interval", 60):
+            message = f"{rule.text} ({rule.value:.2f})"
+            ranking = ALERT_TOP_RANKINGS.get(rule.metric)
+            if ranking and self.top_processes:
+                message += f"\nTop: {format_top(self.top_processes[ranking][:3], ranking)}"
+            self.notify(title, message)
+            self.last_notification_times[rule] = current_time
+
+    def forecast_alert(self, forecast, resolved=False):
+        title = FORECAST_TITLES[forecast.family]
+        if resolved:
+            self.notify(f"{title} resolved", forecast.describe())
+            self.last_notification_times.pop(forecast, None)
+            return
+        current_time = time.monotonic()
+        last_time = self.last_notification_times.get(forecast)
+        if last_time is None or current_time - last_time >= self.config.get("notification_interval", 60):
+            message = forecast.describe()
+            ranking = ALERT_TOP_RANKINGS.get(forecast.metric)
+            if ranking and self.top_processes:
+                message += f"\nTop: {format_top(self.top_processes[ranking][:3], ranking)}"
+            self.notify(title, message)
+            self.last_notification_times[forecast] = current_time
+
+    def stall(self, trigger):
+        # A kernel PSI trigger fired, notified at once but not more often than notification_interval
+        current_time = time.monotonic()
+        last_time = self.last_notification_times.get(trigger)
+        if last_time is None or current_time - last_time >= self.config.get("notification_interval", 60):
+            self.notify("Pressure stall", trigger)
+            self.last_notification_times[trigger] = current_time
+
+    def process(self, snapshot):
+        # Only the metrics read for this snapshot are stored and evaluated, the
+        # sources running at a slower rate are not repeated at every sample.
+        # Temperatures are in Celsius, the threshold is set in °C.
+        with diagnostics.timer("tick"):
+            stats = {"timestamp": snapshot["timestamp"]}
+            for metric in snapshot["fresh"]:
+                stats[metric] = snapshot[metric]
+            self.top_processes = snapshot.get("top_processes")
+            # The process ranking is stored at a slower rate, it is much bigger than a value
+            if "top_processes" in stats:
+                if self.top_processes_stored is not None and stats["timestamp"] - self.top_processes_stored < self.config.get("top_processes_store_interval", 60):
+                    del stats["top_processes"]
+                else:
+                    self.top_processes_stored = stats["timestamp"]
+
+            with diagnostics.timer("alerts"):
+                for rule, event in self.rules.evaluate(stats["timestamp"], stats):
+                    self.alert(rule, resolved=event != FIRING)
+                for rule in self.rules.firing():
+                    self.alert(rule)
+                if self.forecaster:
+                    for forecast, event in self.forecaster.update(stats["timestamp"], stats):
+                        self.forecast_alert(forecast, resolved=event != FIRING)
+                    for forecast in self.forecaster.firing():
+                        self.forecast_alert(forecast)
+
+            self.save_stats(stats)
+            return stats
+
+    def save_stats(self, stats):
+        self.storage.append(stats)
+        self.downsampler.add(stats)
+
+    def prune(self):
+        self.downsampler.prune()
+
+    def close(self):
+        self.storage.close()
+        self.downsampler.close()
@@ -0,0 +1,101 @@
+import re
+import select
+import threading
+import time
+import psutil
+
+MOUNTS_FILE = '/proc/self/mounts'
+
+# Filesystems without their own storage, or whose space is not worth an alert
+DEFAULT_EXCLUDED_FSTYPES = [
+    "tmpfs", "devtmpfs", "overlay", "squashfs", "ramfs", "proc", "sysfs", "cgroup",
+    "cgroup2", "devpts", "mqueue", "debugfs", "tracefs", "securityfs", "pstore",
+    "bpf", "autofs", "fusectl", "configfs", "hugetlbfs", "nsfs", "efivarfs",
+    "binfmt_misc", "rpc_pipefs", "selinuxfs", "fuse.gvfsd-fuse", "fuse.portal",
+]
+
+
+def mount_id(mountpoint):
+    # Metric name part of a mount: / is root, /var/lib is var_lib
+    if mountpoint in ("/", ""):
+        return "root"
+    return re.sub(r'[^\w-]+', '_', mountpoint.strip('/\\')) or "root"
+
+
+class MountTable:
+    # Mounted filesystems, read again only when the mount table changes. On
+    # Linux the kernel flags /proc/self/mounts with POLLPRI on every mount or
+    # umount, elsewhere the table is read again on a slow timer.
+    def __init__(self, excluded_fstypes=None, rescan_interval=60):
+        self.excluded_fstypes = set(DEFAULT_EXCLUDED_FSTYPES if excluded_fstypes is None else excluded_fstypes)
+        self.rescan_interval = rescan_interval
+        self.mounts = {}
+        self.next_rescan = 0
+        self.file = None
+        self.poller = None
+        try:
+            self.file = open(MOUNTS_FILE, 'r')
+            self.poller = select.poll()
+            self.poller.register(self.file, select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            self.close()
+
+    def changed(self, now):
+        if self.poller is not None:
+            return bool(self.poller.poll(0))
+        return now >= self.next_rescan
+
+    def read(self):
+        # {mount id: mountpoint}
+        now = time.monotonic()
+        if self.next_rescan and not self.changed(now):
+            return self.mounts
+        mounts = {}
+        for partition in psutil.disk_partitions(all=True):
+            if partition.fstype in self.excluded_fstypes or not partition.fstype:
+                continue
+            identifier = mount_id(partition.mountpoint)
+            # The same id twice (/a_b and /a/b), the first one stays
+            mounts.setdefault(identifier, partition.mountpoint)
+        self.mounts = mounts
+        self.next_rescan = now + self.rescan_interval
+        return mounts
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.poller = None
+
+
+class UsageReader:
+    # statvfs of each mount in a thread of its own, so a hung network mount
+    # never blocks the sampler: a mount that has not answered within timeout
+    # is left out of this read, and is not asked again while its call hangs.
+    def __init__(self, timeout=2):
+        self.timeout = timeout
+        self.pending = set()
+
+    def read(self, mounts):
+        # {mount id: psutil disk usage}
+        results = {}
+        threads = []
+        for identifier, mountpoint in mounts.items():
+            if identifier in self.pending:
+                continue
+            self.pending.add(identifier)
+            thread = threading.Thread(target=self.statvfs, args=(identifier, mountpoint, results), daemon=True)
+            thread.start()
+            threads.append(thread)
+        deadline = time.monotonic() + self.timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        return dict(results)
+
+    def statvfs(self, identifier, mountpoint, results):
+        try:
+            results[identifier] = psutil.disk_usage(mountpoint)
+        except OSError:
+            pass
+        finally:
+            self.pending.discard(identifier)
@@ -0,0 +1,119 @@
+import heapq
+import time
+import psutil
+
+RANKINGS = ("cpu", "rss", "io")
+
+
+class ProcessEntry:
+    __slots__ = ("process", "name", "time", "cpu_time", "io_bytes", "cpu", "rss", "io")
+
+    def __init__(self, process, name):
+        self.process = process
+        self.name = name
+        self.time = None
+        self.cpu_time = 0.0
+        self.io_bytes = None
+        self.cpu = 0.0
+        self.rss = 0
+        self.io = 0.0
+
+    def row(self):
+        return [self.process.pid, self.name, round(self.cpu, 1), self.rss, round(self.io)]
+
+
+def read_io_bytes(process):
+    # Not available on every system, nor for the processes of other users
+    if not hasattr(process, "io_counters"):
+        return None
+    try:
+        io = process.io_counters()
+    except psutil.AccessDenied:
+        return None
+    return io.read_bytes + io.write_bytes
+
+
+class ProcessTracker:
+    # Top consumers of CPU, RSS and I/O. psutil.Process handles are cached by
+    # (pid, create time) so a reused pid is never mixed up with the old process.
+    # Every process is read on the slow rescan; in between only the current top
+    # candidates are read again, which keeps a tick cheap on hosts with
+    # thousands of processes.
+    def __init__(self, top_n=5, rescan_interval=30):
+        self.top_n = top_n
+        self.rescan_interval = rescan_interval
+        self.entries = {}
+        self.candidates = []
+        self.next_rescan = 0
+
+    def rescan(self, now):
+        # The processes added, their first reading only primes the CPU and I/O rates
+        seen = set()
+        added = []
+        for process in psutil.process_iter(attrs=["name", "create_time"]):
+            key = (process.pid, process.info["create_time"])
+            seen.add(key)
+            if key not in self.entries:
+                self.entries[key] = ProcessEntry(process, process.info["name"])
+                added.append(key)
+        for key in self.entries.keys() - seen:
+            del self.entries[key]
+        self.update(list(self.entries.items()), now)
+        self.next_rescan = now + self.rescan_interval
+        return added
+
+    def update(self, items, now):
+        for key, entry in items:
+            process = entry.process
+            try:
+                # One batched read of /proc for the three values
+                with process.oneshot():
+                    times = process.cpu_times()
+                    rss = process.memory_info().rss
+                    io_bytes = read_io_bytes(process)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                self.entries.pop(key, None)
+                continue
+            except psutil.AccessDenied:
+                continue
+
+            cpu_time = times.user + times.system
+            if entry.time is not None and now > entry.time:
+                elapsed = now - entry.time
+                entry.cpu = (cpu_time - entry.cpu_time) / elapsed * 100
+                if io_bytes is not None and entry.io_bytes is not None:
+                    entry.io = (io_bytes - entry.io_bytes) / elapsed
+            entry.time = now
+            entry.cpu_time = cpu_time
+            entry.io_bytes = io_bytes
+            entry.rss = rss
+
+    def sample(self):
+        # {"cpu": rows, "rss": rows, "io": rows}, a row is [pid, name, cpu %, rss bytes, io bytes/s]
+        now = time.monotonic()
+        added = []
+        if now >= self.next_rescan:
+            added = self.rescan(now)
+            pool = list(self.entries.items())
+        else:
+            self.update(self.candidates, now)
+            pool = [(key, self.entries[key]) for key, _ in self.candidates if key in self.entries]
+
+        top = {}
+        candidates = {}
+        for ranking in RANKINGS:
+            ranked = heapq.nlargest(3 * self.top_n, pool, key=lambda item: getattr(item[1], ranking))
+            top[ranking] = [entry.row() for _, entry in ranked[:self.top_n]]
+            candidates.update(ranked)
+        # Read again on the next tick, which gives them a rate to be ranked on
+        candidates.update((key, self.entries[key]) for key in added if key in self.entries)
+        self.candidates = list(candidates.items())
+        return top
+
+
+def format_top(rows, ranking):
+    if ranking == "rss":
+        return ", ".join(f"{name} ({pid}) {rss / (1024 * 1024):.0f} Mo" for pid, name, cpu, rss, io in rows)
+    if ranking == "io":
+        return ", ".join(f"{name} ({pid}) {io / 1024:.0f} Ko/s" for pid, name, cpu, rss, io in rows)
+    return ", ".join(f"{name} ({pid}) {cpu:.0f}%" for pid, name, cpu, rss, io in rows)
@@ -0,0 +1,103 @@
+import os
+import re
+import select
+import time
+
+PRESSURE_DIR = '/proc/pressure'
+RESOURCES = ("cpu", "memory", "io")
+
+# "memory some 150ms 2s": a memory stall of some tasks for 150 ms within a 2 s
+# window. Unprivileged users need a window that is a multiple of 2 s.
+TRIGGER_PATTERN = re.compile(r'^\s*(?P<resource>cpu|memory|io)\s+(?P<kind>some|full)\s+(?P<stall>[\d.]+)(?P<stall_unit>ms|s)\s+(?P<window>[\d.]+)(?P<window_unit>ms|s)\s*$')
+MICROSECONDS = {"ms": 1000, "s": 1000000}
+
+
+def parse_pressure(text):
+    # "some avg10=0.00 avg60=0.00 avg300=0.00 total=0" lines as {"some": {"avg10": 0.0, ..., "total": 0}}
+    pressure = {}
+    for line in text.splitlines():
+        kind, *fields = line.split()
+        values = {}
+        for field in fields:
+            key, _, value = field.partition("=")
+            values[key] = int(value) if key == "total" else float(value)
+        pressure[kind] = values
+    return pressure
+
+
+class PressureReader:
+    # The /proc/pressure files, kept open and read with one pread per tick
+    def __init__(self, directory=PRESSURE_DIR):
+        self.handles = {}
+        for resource in RESOURCES:
+            try:
+                self.handles[resource] = os.open(os.path.join(directory, resource), os.O_RDONLY)
+            except OSError:
+                # Kernel without PSI, or older than the cpu file
+                pass
+
+    def read(self):
+        # {resource: parsed pressure}
+        pressures = {}
+        for resource, fd in list(self.handles.items()):
+            try:
+                pressures[resource] = parse_pressure(os.pread(fd, 4096, 0).decode())
+            except OSError:
+                # PSI disabled on the kernel command line (psi=0)
+                os.close(self.handles.pop(resource))
+        return pressures
+
+    def close(self):
+        for fd in self.handles.values():
+            os.close(fd)
+        self.handles = {}
+
+
+class PressureTrigger:
+    def __init__(self, text, directory=PRESSURE_DIR):
+        match = TRIGGER_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Invalid PSI trigger: {text}")
+        self.text = text.strip()
+        self.resource = match.group("resource")
+        stall = int(float(match.group("stall")) * MICROSECONDS[match.group("stall_unit")])
+        window = int(float(match.group("window")) * MICROSECONDS[match.group("window_unit")])
+        # The kernel watches the file while it stays open, and flags it with POLLPRI
+        self.fd = os.open(os.path.join(directory, self.resource), os.O_RDWR | os.O_NONBLOCK)
+        try:
+            os.write(self.fd, f"{match.group('kind')} {stall} {window}\0".encode())
+        except OSError as e:
+            os.close(self.fd)
+            raise ValueError(f"PSI trigger refused by the kernel: {text} ({e.strerror})")
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PressureTriggers:
+    # Kernel PSI triggers: the kernel wakes us as soon as a stall crosses its
+    # threshold, instead of the next check_interval tick finding it
+    def __init__(self, specs):
+        self.triggers = {}
+        for spec in specs:
+            try:
+                trigger = PressureTrigger(spec)
+            except (ValueError, OSError) as e:
+                print(f"Ignored PSI trigger : {e}")
+                continue
+            self.triggers[trigger.fd] = trigger
+        self.poller = select.poll()
+        for fd in self.triggers:
+            self.poller.register(fd, select.POLLPRI)
+
+    def wait(self, timeout):
+        # Sleeps up to timeout seconds, returns the triggers that fired meanwhile
+        if not self.triggers:
+            time.sleep(timeout)
+            return []
+        return [self.triggers[fd] for fd, _ in self.poller.poll(timeout * 1000) if fd in self.triggers]
+
+    def close(self):
+        for trigger in self.triggers.values():
+            trigger.close()
+        self.triggers = {}
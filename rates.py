@@ -0,0 +1,34 @@
+import time
+
+
+def counter_delta(old, new):
+    if new >= old:
+        return new - old
+    # Went backwards: a 32 bit counter that wrapped, or a device that was reset
+    if 2 ** 31 <= old < 2 ** 32:
+        return new + 2 ** 32 - old
+    return None
+
+
+class RateCounter:
+    # Per second rates of cumulative counters, keyed by name. A new key has no
+    # rate until its second reading, a key that disappears is forgotten.
+    def __init__(self):
+        self.previous = {}
+        self.time = None
+
+    def update(self, counters, now=None):
+        now = now if now is not None else time.monotonic()
+        rates = {}
+        if self.time is not None and now > self.time:
+            elapsed = now - self.time
+            for key, value in counters.items():
+                old = self.previous.get(key)
+                if old is None:
+                    continue
+                delta = counter_delta(old, value)
+                if delta is not None:
+                    rates[key] = delta / elapsed
+        self.previous = counters
+        self.time = now
+        return rates
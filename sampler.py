@@ -0,0 +1,77 @@
+import time
+from PySide6.QtCore import QObject, QThread, QTimer, QMetaObject, QSocketNotifier, Qt, Signal
+from collector import SystemCollector
+
+
+class Sampler(QObject):
+    # Runs the collector on its own thread, so slow sensor or disk reads never
+    # block the UI. Every consumer gets the same snapshot through snapshot_ready,
+    # and the last one stays available in latest. Snapshots are shared between
+    # the consumers and must not be modified.
+    snapshot_ready = Signal(object)
+    config_changed = Signal(object)
+    # A kernel PSI trigger fired, with the trigger text
+    stall = Signal(str)
+
+    def __init__(self, config=None):
+        super().__init__()
+        self.config = config or {}
+        self.collector = None
+        self.latest = None
+        self.timer = None
+        self.notifiers = []
+
+        self.worker_thread = QThread()
+        self.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.start_timer)
+
+    def start(self):
+        self.worker_thread.start()
+
+    def start_timer(self):
+        # Runs in the worker thread, so the collector, the timer and its timeouts live there too
+        self.collector = SystemCollector(self.config)
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.sample)
+        self.config_changed.connect(self.configure)
+        self.watch_triggers()
+        self.sample()
+
+    def watch_triggers(self):
+        # The kernel flags a fired trigger as an exceptional condition (POLLPRI)
+        self.notifiers = []
+        for fd, trigger in self.collector.triggers.triggers.items():
+            notifier = QSocketNotifier(fd, QSocketNotifier.Exception)
+            notifier.activated.connect(lambda *args, text=trigger.text: self.stall.emit(text))
+            self.notifiers.append(notifier)
+
+    def set_config(self, config):
+        self.config_changed.emit(dict(config))
+
+    def configure(self, config):
+        self.config = config
+        # The notifiers go before their file descriptors are closed
+        for notifier in self.notifiers:
+            notifier.setEnabled(False)
+        self.collector.configure(config)
+        self.watch_triggers()
+        self.sample()
+
+    def sample(self):
+        snapshot = self.collector.collect_due()
+        if snapshot["fresh"]:
+            self.latest = snapshot
+            self.snapshot_ready.emit(snapshot)
+        # Sleep until the next source is due
+        delay = max(0, self.collector.next_due() - time.monotonic())
+        self.timer.start(int(delay * 1000))
+
+    def stop(self):
+        # The timer can only be stopped from its own thread
+        if self.timer:
+            QMetaObject.invokeMethod(self.timer, "stop", Qt.BlockingQueuedConnection)
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        if self.collector:
+            self.collector.close()
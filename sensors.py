@@ -0,0 +1,123 @@
+import fnmatch
+import glob
+import os
+import re
+import time
+import psutil
+
+HWMON_DIR = '/sys/class/hwmon'
+THERMAL_DIR = '/sys/class/thermal'
+
+
+def sensor_id(*parts):
+    return "_".join(re.sub(r'[^a-z0-9]+', '_', part.lower()).strip('_') for part in parts if part)
+
+
+def read_text(path):
+    try:
+        with open(path, 'r') as file:
+            return file.read().strip()
+    except OSError:
+        return ""
+
+
+def discover_sensors():
+    # Every temperature input of sysfs as {id: path}
+    sensors = {}
+    for hwmon in sorted(glob.glob(os.path.join(HWMON_DIR, 'hwmon*'))):
+        chip = read_text(os.path.join(hwmon, 'name')) or os.path.basename(hwmon)
+        for path in sorted(glob.glob(os.path.join(hwmon, 'temp*_input'))):
+            base = path[:-len('_input')]
+            label = read_text(base + '_label') or os.path.basename(base)
+            identifier = sensor_id(chip, label)
+            # Same chip and label twice (two NVMe drives...), keep both
+            if identifier in sensors:
+                identifier = sensor_id(chip, os.path.basename(hwmon), label)
+            sensors[identifier] = path
+    for zone in sorted(glob.glob(os.path.join(THERMAL_DIR, 'thermal_zone*'))):
+        zone_type = read_text(os.path.join(zone, 'type')) or os.path.basename(zone)
+        identifier = sensor_id("thermal", zone_type)
+        if identifier in sensors:
+            identifier = sensor_id("thermal", os.path.basename(zone))
+        sensors[identifier] = os.path.join(zone, 'temp')
+    return sensors
+
+
+class SensorRegistry:
+    # Temperature sensors discovered once, then read through kept open file
+    # handles: one pread per selected sensor and per tick. The discovery runs
+    # again on a slow timer and whenever a sensor disappears (hotplug).
+    # selection is a list of sensor ids or glob patterns, all the hwmon
+    # sensors when empty (the thermal zones if there is no hwmon sensor).
+    def __init__(self, selection=None, rescan_interval=60):
+        self.selection = selection or []
+        self.rescan_interval = rescan_interval
+        self.available = {}
+        self.handles = {}
+        self.next_rescan = 0
+        self.use_psutil = not os.path.isdir(HWMON_DIR) and not os.path.isdir(THERMAL_DIR)
+
+    def set_selection(self, selection):
+        # Applied on the next read
+        self.selection = selection or []
+        self.next_rescan = 0
+
+    def selected(self, sensors):
+        if self.selection:
+            return {identifier: path for identifier, path in sensors.items()
+                    if any(fnmatch.fnmatch(identifier, pattern) for pattern in self.selection)}
+        hwmon = {identifier: path for identifier, path in sensors.items() if not identifier.startswith("thermal_")}
+        return hwmon or sensors
+
+    def rescan(self):
+        self.available = discover_sensors()
+        wanted = self.selected(self.available)
+        for identifier in list(self.handles):
+            if wanted.get(identifier) != self.handles[identifier][0]:
+                os.close(self.handles.pop(identifier)[1])
+        for identifier, path in wanted.items():
+            if identifier not in self.handles:
+                try:
+                    self.handles[identifier] = (path, os.open(path, os.O_RDONLY))
+                except OSError:
+                    continue
+        self.next_rescan = time.monotonic() + self.rescan_interval
+
+    def read(self):
+        # {sensor id: temperature in °C}
+        if self.use_psutil:
+            return self.read_psutil()
+        if time.monotonic() >= self.next_rescan:
+            self.rescan()
+
+        temperatures = {}
+        lost = False
+        for identifier, (_, fd) in self.handles.items():
+            try:
+                temperatures[identifier] = int(os.pread(fd, 32, 0)) / 1000
+            except ValueError:
+                continue
+            except OSError:
+                # Some sensors have no value for a while, a removed device stays in error
+                lost = True
+        if lost:
+            self.next_rescan = min(self.next_rescan, time.monotonic() + 5)
+        return temperatures
+
+    def read_psutil(self):
+        # Other systems than Linux have no sysfs
+        sensors_temperatures = getattr(psutil, "sensors_temperatures", None)
+        if not sensors_temperatures:
+            return {}
+        temperatures = {}
+        for chip, entries in (sensors_temperatures() or {}).items():
+            for index, entry in enumerate(entries):
+                identifier = sensor_id(chip, entry.label or f"temp{index + 1}")
+                if not self.selection or any(fnmatch.fnmatch(identifier, pattern) for pattern in self.selection):
+                    temperatures[identifier] = entry.current
+        return temperatures
+
+    def close(self):
+        for _, fd in self.handles.values():
+            os.close(fd)
+        self.handles = {}
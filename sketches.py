@@ -0,0 +1,213 @@
+import math
+import os
+from stats_segments import SegmentReader
+
+# Streaming quantiles with a DDSketch: every value goes to a bin of
+# logarithmic width, so any quantile comes back within RELATIVE_ACCURACY of
+# its true value, in a few hundred bins whatever the number of samples. Two
+# sketches merge by adding their bins, so a long window is the merge of the
+# sketches of its buckets.
+#
+# Values are weighted by the time they stand for (seconds), so the quantiles,
+# the mean and the time past a threshold stay right when the sampling rate changes.
+RELATIVE_ACCURACY = 0.01
+# Beyond this the lowest bins are merged, the high quantiles stay exact
+MAX_BINS = 2048
+# Values closer to zero than this are counted as zero
+MIN_VALUE = 1e-9
+
+# (name, bucket, retention) of the stored sketches, under the stats directory
+SKETCH_TIERS = [
+    ("sketch-5m", 300, 2 * 24 * 3600),
+    ("sketch-1h", 3600, 90 * 24 * 3600),
+]
+# A window takes the finest tier that needs no more than this many merges
+MAX_MERGES = 100
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # {bin key: weight}, negative values in their own bins by absolute value
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0.0
+        self.weight = 0.0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def key(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def bin_value(self, key):
+        # The middle of the bin, within relative_accuracy of everything in it
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, weight=1.0):
+        if value > MIN_VALUE:
+            bins = self.positive
+            key = self.key(value)
+        elif value < -MIN_VALUE:
+            bins = self.negative
+            key = self.key(-value)
+        else:
+            bins = None
+            self.zero += weight
+        if bins is not None:
+            bins[key] = bins.get(key, 0.0) + weight
+            if len(bins) > MAX_BINS:
+                self.collapse(bins)
+        self.weight += weight
+        self.count += 1
+        self.total += value * weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def collapse(self, bins):
+        # The lowest bins of the positive values, the smallest magnitudes of the negative ones
+        keys = sorted(bins)
+        excess = keys[:len(keys) - MAX_BINS + 1]
+        weight = sum(bins.pop(key) for key in excess)
+        bins[excess[-1]] = bins.get(excess[-1], 0.0) + weight
+
+    def merge(self, other):
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, weight in other_bins.items():
+                bins[key] = bins.get(key, 0.0) + weight
+            if len(bins) > MAX_BINS:
+                self.collapse(bins)
+        self.zero += other.zero
+        self.weight += other.weight
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.total / self.weight if self.weight else math.nan
+
+    def quantile(self, fraction):
+        if not self.weight:
+            return math.nan
+        rank = fraction * self.weight
+        cumulative = 0.0
+        # From the most negative value up
+        for key in sorted(self.negative, reverse=True):
+            cumulative += self.negative[key]
+            if cumulative >= rank:
+                return max(-self.bin_value(key), self.min)
+        cumulative += self.zero
+        if cumulative >= rank:
+            return 0.0
+        for key in sorted(self.positive):
+            cumulative += self.positive[key]
+            if cumulative >= rank:
+                return min(self.bin_value(key), self.max)
+        return self.max
+
+    def weight_above(self, threshold):
+        # Weight (seconds) of the values above threshold, to the bin
+        if threshold >= self.max:
+            return 0.0
+        if threshold < self.min:
+            return self.weight
+        above = sum(weight for key, weight in self.positive.items() if self.bin_value(key) > threshold)
+        if threshold < 0:
+            above += self.zero
+            above += sum(weight for key, weight in self.negative.items() if -self.bin_value(key) > threshold)
+        return above
+
+    def weight_below(self, threshold):
+        return self.weight - self.weight_above(threshold)
+
+    def to_dict(self):
+        return {
+            "p": [[key, weight] for key, weight in self.positive.items()],
+            "n": [[key, weight] for key, weight in self.negative.items()],
+            "z": self.zero,
+            "w": self.weight,
+            "c": self.count,
+            "t": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.positive = {key: weight for key, weight in data.get("p", [])}
+        sketch.negative = {key: weight for key, weight in data.get("n", [])}
+        sketch.zero = data.get("z", 0.0)
+        sketch.weight = data.get("w", 0.0)
+        sketch.count = data.get("c", 0)
+        sketch.total = data.get("t", 0.0)
+        sketch.min = data.get("min", math.inf)
+        sketch.max = data.get("max", -math.inf)
+        return sketch
+
+
+class SketchReader:
+    # The stored sketches of a stats directory for the summaries, over the last
+    # span seconds (the longest window shown) at most. The buckets are read
+    # from the disk once, a refresh only reads the lines appended since, and
+    # each sketch is decoded the first time a window needs it.
+    def __init__(self, stats_dir, span=None):
+        self.stats_dir = stats_dir
+        self.span = span
+        # name -> (bucket, retention, {bucket start: record})
+        self.tiers = {name: (bucket, retention, {}) for name, bucket, retention in SKETCH_TIERS}
+        self.readers = {name: SegmentReader(os.path.join(stats_dir, name)) for name in self.tiers}
+        self.decoded = {}
+
+    def refresh(self, now):
+        for name, (bucket, retention, records) in self.tiers.items():
+            start = now - (retention if self.span is None else min(retention, self.span))
+            for record in self.readers[name].read(start):
+                records[int(record["timestamp"])] = record
+            for expired in [timestamp for timestamp in records if timestamp < start]:
+                del records[expired]
+                self.decoded.pop((name, expired), None)
+
+    def choose(self, span):
+        for name, (bucket, _, _) in self.tiers.items():
+            if span / bucket <= MAX_MERGES:
+                return name
+        return list(self.tiers)[-1]
+
+    def sketch(self, name, timestamp, metric):
+        decoded = self.decoded.setdefault((name, timestamp), {})
+        if metric not in decoded:
+            data = self.tiers[name][2][timestamp].get(metric)
+            decoded[metric] = DDSketch.from_dict(data) if isinstance(data, dict) else None
+        return decoded[metric]
+
+    def window(self, metric, span, now, raw=None):
+        # The merged sketch of metric over the last span seconds: the stored
+        # buckets that start inside it, then the raw samples (a StatsHistory)
+        # since the end of the last stored bucket
+        name = self.choose(span)
+        bucket, _, records = self.tiers[name]
+        merged = DDSketch()
+        covered = now - span
+        for timestamp in sorted(records):
+            if timestamp < now - span:
+                continue
+            sketch = self.sketch(name, timestamp, metric)
+            if sketch is not None:
+                merged.merge(sketch)
+            covered = timestamp + bucket
+        if raw is not None and metric in raw.metric_names():
+            timestamps, values = raw.query(metric, covered, now)
+            previous = None
+            for timestamp, value in zip(timestamps, values):
+                if not math.isnan(value):
+                    gap = timestamp - previous if previous is not None else 1
+                    merged.add(value, min(max(gap, 1), SKETCH_TIERS[0][1]))
+                    previous = timestamp
+        return merged
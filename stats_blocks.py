@@ -0,0 +1,189 @@
+import json
+import math
+import operator
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate, islice
+from stats_history import parse_timestamp
+
+# Compressed columnar file for a closed segment, Gorilla style: delta of delta
+# timestamps and each float XORed with the previous one of its metric. Instead
+# of bit packing, which is slow in pure Python, the 8 byte words are shuffled
+# (every first byte, then every second byte...) and deflated: the runs of zero
+# bytes that delta of delta and XOR leave compress just as well.
+#
+#   MAGIC, block, block, ..., index (JSON), FOOTER (index offset, MAGIC)
+#
+# A block holds up to BLOCK_SIZE samples: a header (JSON, its length first)
+# then the timestamps, one payload per numeric metric, and the other values
+# (top_processes...) as JSON. The index gives the offset, the length and the
+# time range of every block, so a range read only decodes the blocks it needs.
+MAGIC = b"SNTB"
+FOOTER = struct.Struct("<Q4s")
+HEADER_LENGTH = struct.Struct("<I")
+BLOCK_SIZE = 1024
+NAN = float('nan')
+
+
+def shuffle(data, width=8):
+    return b"".join(data[i::width] for i in range(width))
+
+
+def unshuffle(data, width=8):
+    out = bytearray(len(data))
+    count = len(data) // width
+    for i in range(width):
+        out[i::width] = data[i * count:(i + 1) * count]
+    return bytes(out)
+
+
+def pack_words(words):
+    # array of 8 byte words as shuffled, deflated little endian bytes
+    if sys.byteorder == "big":
+        words.byteswap()
+    return zlib.compress(shuffle(words.tobytes()))
+
+
+def unpack_words(typecode, payload):
+    words = array(typecode)
+    words.frombytes(unshuffle(zlib.decompress(payload)))
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def encode_block(samples):
+    # samples sorted by time, each with a parsed epoch timestamp
+    timestamps = array('q', (sample["timestamp"] for sample in samples))
+    deltas = array('q', map(operator.sub, timestamps, [0] + list(timestamps[:-1])))
+    delta_of_deltas = array('q', map(operator.sub, deltas, [0] + list(deltas[:-1])))
+
+    names = []
+    extra = {}
+    for sample in samples:
+        for name, value in sample.items():
+            if name == "timestamp" or name in extra:
+                continue
+            if not is_number(value):
+                extra[name] = []
+            elif name not in names:
+                names.append(name)
+    names = [name for name in names if name not in extra]
+
+    payloads = [pack_words(delta_of_deltas)]
+    columns = []
+    for name in names:
+        values = array('d', (sample.get(name, NAN) for sample in samples))
+        bits = array('Q')
+        bits.frombytes(values.tobytes())
+        xored = array('Q', map(operator.xor, bits, islice([0] + list(bits), len(bits))))
+        payload = pack_words(xored)
+        payloads.append(payload)
+        columns.append([name, len(payload)])
+    for row, sample in enumerate(samples):
+        for name in extra:
+            if name in sample:
+                extra[name].append([row, sample[name]])
+    payloads.append(zlib.compress(json.dumps(extra, separators=(',', ':')).encode()))
+
+    header = json.dumps({
+        "count": len(samples),
+        "timestamps": len(payloads[0]),
+        "columns": columns,
+        "extra": len(payloads[-1]),
+    }, separators=(',', ':')).encode()
+    return HEADER_LENGTH.pack(len(header)) + header + b"".join(payloads)
+
+
+def decode_columns(data, names=None):
+    # (timestamps, {metric: float array}, {name: [[row, value]]}) of a block.
+    # With names, only those metrics are decoded and the other values are left out.
+    length, = HEADER_LENGTH.unpack_from(data)
+    position = HEADER_LENGTH.size + length
+    header = json.loads(data[HEADER_LENGTH.size:position])
+
+    end = position + header["timestamps"]
+    deltas = accumulate(unpack_words('q', data[position:end]))
+    timestamps = array('q', accumulate(deltas))
+    position = end
+
+    columns = {}
+    for name, size in header["columns"]:
+        if names is not None and name not in names:
+            position += size
+            continue
+        xored = unpack_words('Q', data[position:position + size])
+        position += size
+        bits = array('Q', accumulate(xored, operator.xor))
+        values = array('d')
+        values.frombytes(bits.tobytes())
+        columns[name] = values
+    extra = {} if names is not None else json.loads(zlib.decompress(data[position:position + header["extra"]]))
+    return timestamps, columns, extra
+
+
+def decode_block(data, names=None):
+    # The samples of a block, as the dicts they were written from
+    timestamps, columns, extra = decode_columns(data, names)
+    samples = [{"timestamp": timestamp} for timestamp in timestamps]
+    for name, values in columns.items():
+        for sample, value in zip(samples, values):
+            if not math.isnan(value):
+                sample[name] = value
+    for name, rows in extra.items():
+        for row, value in rows:
+            samples[row][name] = value
+    return samples
+
+
+def write_blocks(path, samples, block_size=BLOCK_SIZE):
+    # Written aside and renamed, a reader never sees a partial file
+    samples = [dict(sample, timestamp=parse_timestamp(sample.get("timestamp"))) for sample in samples]
+    samples = [sample for sample in samples if sample["timestamp"] is not None]
+    index = []
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as file:
+        file.write(MAGIC)
+        for i in range(0, len(samples), block_size):
+            block = samples[i:i + block_size]
+            data = encode_block(block)
+            index.append([file.tell(), len(data), block[0]["timestamp"], block[-1]["timestamp"]])
+            file.write(data)
+        index_offset = file.tell()
+        file.write(json.dumps(index, separators=(',', ':')).encode())
+        file.write(FOOTER.pack(index_offset, MAGIC))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def read_index(file):
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    if size < len(MAGIC) + FOOTER.size:
+        return []
+    file.seek(size - FOOTER.size)
+    index_offset, magic = FOOTER.unpack(file.read(FOOTER.size))
+    if magic != MAGIC:
+        return []
+    file.seek(index_offset)
+    return json.loads(file.read(size - FOOTER.size - index_offset))
+
+
+def read_blocks(path, start=None, names=None):
+    # The samples of the blocks that reach start, the others are not decoded
+    samples = []
+    with open(path, 'rb') as file:
+        for offset, length, first, last in read_index(file):
+            if start is not None and last < start:
+                continue
+            file.seek(offset)
+            samples.extend(decode_block(file.read(length), names))
+    return samples
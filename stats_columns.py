@@ -0,0 +1,476 @@
+import mmap
+import os
+import shutil
+from array import array
+from bisect import bisect_left, bisect_right
+from stats_blocks import is_number
+from stats_history import StatsHistory, parse_timestamp, NAN
+from stats_segments import SegmentReader, SegmentHistory, first_timestamp
+
+# Columnar copy of a stats directory, for the viewers: one row major file,
+# mapped in memory. The viewers read each column through a zero copy strided
+# view, so opening a history costs the page faults of the range it shows, and
+# every window and process reading it shares the same page cache.
+#
+#   <stats dir>/columns-<serial>.rows
+#       header  rows, width, base, header size, layout length (int64 each),
+#               then the layout: one line per metric, "c <metric>" for the
+#               column of the next slot, "s <metric>" for a sparse metric
+#       rows    width words per row: the timestamp (int64) then one float per
+#               slot, NaN when the sample has no value for it
+#
+# A new metric gets a slot at once, so the viewers see its first sample with
+# the row. Unless it shows up in DENSE_FRACTION of the rows over its first
+# PROBATION_ROWS, it is then sparse: its slot is kept up to the next file, which
+# leaves it out, and it is read from the segments (SegmentHistory) from there.
+# The _min, _max and _count of the rollups are metrics like the others, the
+# charts draw their envelope from the map. The
+# rows are written whole, so the file is grown with truncate, without filling.
+# base is the absolute number of the first row: pruning, or running out of
+# slots, writes a new file with the next serial and the viewers follow it.
+COLUMNS_PREFIX = 'columns-'
+COLUMNS_SUFFIX = '.rows'
+ROWS, WIDTH, BASE, HEADER_SIZE, LAYOUT_LENGTH = range(5)
+FIXED_HEADER = 5 * 8
+PAGE = 4096
+CHUNK_ROWS = 4096
+MIN_WIDTH = 16
+WORD = 8
+PROBATION_ROWS = 16
+DENSE_FRACTION = 1 / 8
+# Written by the rollups next to each average, and read with it
+AGGREGATE_SUFFIXES = ("_min", "_max", "_count")
+
+
+def generation_serial(path):
+    return int(os.path.basename(path)[len(COLUMNS_PREFIX):-len(COLUMNS_SUFFIX)])
+
+
+def latest_generation(directory):
+    if not os.path.isdir(directory):
+        return None
+    names = [name for name in os.listdir(directory)
+             if name.startswith(COLUMNS_PREFIX) and name.endswith(COLUMNS_SUFFIX)
+             and name[len(COLUMNS_PREFIX):-len(COLUMNS_SUFFIX)].isdigit()]
+    return os.path.join(directory, max(names)) if names else None
+
+
+def is_aggregate(metric, metrics):
+    return metric.endswith(AGGREGATE_SUFFIXES) and metric.rsplit("_", 1)[0] in metrics
+
+
+def parse_layout(text):
+    # ({metric: slot}, {sparse metric}), a sparse metric keeps its slot up to the next file
+    slots = {}
+    sparse = set()
+    for line in text.splitlines():
+        kind, _, metric = line.partition(" ")
+        if kind == "c":
+            slots[metric] = len(slots) + 1
+        elif kind == "s":
+            sparse.add(metric)
+    return slots, sparse
+
+
+def map_file(path, writable=False):
+    # The mmap of a file, None if it is missing or empty. mmap errors (ENOMEM
+    # past vm.max_map_count...) are left to the caller.
+    try:
+        fd = os.open(path, os.O_RDWR if writable else os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        if os.fstat(fd).st_size < FIXED_HEADER:
+            return None
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+
+
+class MappedRows:
+    # The views of one mapped generation file
+    def __init__(self, column_map):
+        self.map = column_map
+        self.words = memoryview(column_map)[:FIXED_HEADER].cast('q')
+        self.width = self.words[WIDTH]
+        self.base = self.words[BASE]
+        self.header_size = self.words[HEADER_SIZE]
+        self.capacity = (len(column_map) - self.header_size) // (self.width * WORD)
+        self.data = memoryview(column_map)[self.header_size:self.header_size + self.capacity * self.width * WORD]
+        self.ints = self.data.cast('q')
+        self.floats = self.data.cast('d')
+
+    def layout(self):
+        length = self.words[LAYOUT_LENGTH]
+        return bytes(self.map[FIXED_HEADER:FIXED_HEADER + length]).decode()
+
+    def timestamps(self, rows):
+        return self.ints[0:rows * self.width:self.width]
+
+    def column(self, slot, rows):
+        return self.floats[slot:rows * self.width:self.width]
+
+    def close(self):
+        for view in (self.ints, self.floats, self.data, self.words):
+            view.release()
+        self.map.close()
+
+
+class ColumnWriter:
+    # Written by StatsStorage at every append, no fsync: the segments stay the
+    # durable copy, and the columns are built again from them when they are
+    # missing. A failure (no more maps, no more space) turns the columns off
+    # and removes them, the viewers then read the segments.
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = None
+        self.rows_map = None
+        self.serial = 0
+        self.base = 0
+        self.rows = 0
+        self.slots = {}
+        self.sparse = set()
+        # Metric in probation -> [absolute row it first showed up, rows with a value]
+        self.pending = {}
+        self.failed = False
+        try:
+            path = latest_generation(directory)
+            if path and not self.open(path):
+                # Left inconsistent by a crash, the segments have it all
+                self.close()
+                self.path = None
+                self.rows = 0
+                self.slots = {}
+                self.sparse = set()
+            # Generations a viewer still mapped when they were replaced (they cannot be removed then on Windows)
+            self.remove_generations(keep=self.path)
+        except OSError as e:
+            self.fail(e)
+
+    def open(self, path):
+        self.path = path
+        self.serial = generation_serial(path)
+        column_map = map_file(path, writable=True)
+        if column_map is None:
+            return False
+        self.rows_map = MappedRows(column_map)
+        self.base = self.rows_map.base
+        self.rows = self.rows_map.words[ROWS]
+        self.slots, self.sparse = parse_layout(self.rows_map.layout())
+        self.empty_row = array('d', [NAN]) * self.rows_map.width
+        return self.rows <= self.rows_map.capacity and len(self.slots) < self.rows_map.width
+
+    def remove_generations(self, keep=None):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.startswith(COLUMNS_PREFIX) or path == keep:
+                continue
+            # The column directories of the first format too
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def fail(self, error):
+        print(f"Ignored stats columns of {self.directory} : {error}")
+        self.failed = True
+        self.close()
+        self.remove_generations()
+
+    def rewrite(self, first=0, width=None):
+        # A new generation with the rows from first on, written aside then
+        # renamed, without the slots of the sparse metrics
+        old = self.rows_map
+        end = self.base + self.rows
+        for metric, (start, _) in list(self.pending.items()):
+            if end - start >= PROBATION_ROWS:
+                self.decide(metric)
+        old_slots = self.slots
+        slots = {}
+        for metric in sorted(old_slots, key=old_slots.get):
+            if metric not in self.sparse:
+                slots[metric] = len(slots) + 1
+        width = max(width or (old.width if old else MIN_WIDTH), len(slots) + 1)
+        kept = self.rows - first
+        layout = ("".join(f"c {metric}\n" for metric in slots) + "".join(f"s {metric}\n" for metric in sorted(self.sparse))).encode()
+        header_size = max(PAGE, -(-2 * (FIXED_HEADER + len(layout)) // PAGE) * PAGE)
+        capacity = kept + CHUNK_ROWS
+        path = os.path.join(self.directory, f"{COLUMNS_PREFIX}{self.serial + 1:012d}{COLUMNS_SUFFIX}")
+        temporary = path + ".tmp"
+        with open(temporary, 'wb') as file:
+            file.write(array('q', [kept, width, self.base + first, header_size, len(layout)]).tobytes() + layout)
+            file.truncate(header_size + capacity * width * WORD)
+        new = MappedRows(map_file(temporary, writable=True))
+        try:
+            if old and kept:
+                if old.width == width and slots == old_slots:
+                    new.data[:kept * width * WORD] = old.data[first * width * WORD:self.rows * width * WORD]
+                else:
+                    new.ints[0:kept * width:width] = old.ints[first * old.width:self.rows * old.width:old.width]
+                    empty = array('d', [NAN]) * kept
+                    for slot in range(1, width):
+                        new.floats[slot:kept * width:width] = empty
+                    for metric, slot in slots.items():
+                        old_slot = old_slots[metric]
+                        # The slot a new metric just got is past the old rows
+                        if old_slot >= old.width:
+                            continue
+                        new.floats[slot:kept * width:width] = old.floats[first * old.width + old_slot:self.rows * old.width:old.width]
+        finally:
+            new.close()
+        os.replace(temporary, path)
+        old_path = self.path
+        self.close()
+        self.open(path)
+        # The viewers still mapping the old file keep it until they move to the new one
+        if old_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def grow(self):
+        capacity = self.rows_map.capacity + max(CHUNK_ROWS, self.rows_map.capacity // 2)
+        size = self.rows_map.header_size + capacity * self.rows_map.width * WORD
+        self.close()
+        os.truncate(self.path, size)
+        self.open(self.path)
+
+    def last_timestamp(self):
+        if not self.rows or self.failed:
+            return None
+        return self.rows_map.ints[(self.rows - 1) * self.rows_map.width]
+
+    def append(self, sample):
+        if self.failed:
+            return
+        timestamp = parse_timestamp(sample.get("timestamp"))
+        if timestamp is None:
+            return
+        try:
+            self.write(timestamp, sample)
+        except OSError as e:
+            self.fail(e)
+
+    def write(self, timestamp, sample):
+        if self.rows_map is None:
+            self.rewrite()
+        metrics = [metric for metric, value in sample.items() if metric != "timestamp" and is_number(value)]
+        for metric in metrics:
+            if metric not in self.slots and metric not in self.sparse:
+                # A slot at once, the probation decides if it keeps it
+                self.pending[metric] = [self.base + self.rows, 0]
+                self.slots[metric] = len(self.slots) + 1
+                self.publish(f"c {metric}\n", self.slots[metric] + 1)
+        if self.rows >= self.rows_map.capacity:
+            self.grow()
+        # Sorted like StatsHistory, for the binary searches of the viewers
+        last = self.last_timestamp()
+        if last is not None and timestamp < last:
+            timestamp = last
+        row = self.rows
+        values = array('d', self.empty_row)
+        for metric in metrics:
+            slot = self.slots.get(metric)
+            if slot:
+                values[slot] = sample[metric]
+        width = self.rows_map.width
+        self.rows_map.floats[row * width:(row + 1) * width] = values
+        self.rows_map.ints[row * width] = timestamp
+        # The row count last, a viewer never sees a half written row
+        self.rows = row + 1
+        self.rows_map.words[ROWS] = self.rows
+        for metric in metrics:
+            probation = self.pending.get(metric)
+            if probation:
+                probation[1] += 1
+                if self.base + self.rows - probation[0] >= PROBATION_ROWS:
+                    self.decide(metric)
+                    if metric in self.sparse:
+                        self.publish(f"s {metric}\n", len(self.slots) + 1)
+
+    def decide(self, metric):
+        # End of the probation: a sparse metric leaves its slot with the next file
+        start, count = self.pending.pop(metric)
+        if count < (self.base + self.rows - start) * DENSE_FRACTION:
+            self.sparse.add(metric)
+
+    def publish(self, line, width):
+        # Add a line to the layout in place, or write a new generation when
+        # the header or the rows are too small for it
+        data = line.encode()
+        length = self.rows_map.words[LAYOUT_LENGTH]
+        if width > self.rows_map.width:
+            self.rewrite(0, self.rows_map.width + max(MIN_WIDTH // 2, self.rows_map.width // 2))
+        elif FIXED_HEADER + length + len(data) > self.rows_map.header_size:
+            self.rewrite()
+        else:
+            self.rows_map.map[FIXED_HEADER + length:FIXED_HEADER + length + len(data)] = data
+            # The length last, a viewer never reads a half written line
+            self.rows_map.words[LAYOUT_LENGTH] = length + len(data)
+
+    def prune(self, cutoff):
+        # A new generation without the expired rows, once they are a good part of the file
+        if self.rows_map is None or self.failed:
+            return
+        try:
+            expired = bisect_left(self.rows_map.timestamps(self.rows), cutoff)
+            if expired >= max(CHUNK_ROWS, self.rows // 4):
+                self.rewrite(expired)
+        except OSError as e:
+            self.fail(e)
+
+    def truncate(self, timestamp):
+        # Drop the rows after timestamp, None for all of them
+        if self.rows_map is None or self.failed:
+            return
+        rows = 0 if timestamp is None else bisect_right(self.rows_map.timestamps(self.rows), timestamp)
+        if rows < self.rows:
+            self.rows = rows
+            self.rows_map.words[ROWS] = rows
+
+    def close(self):
+        if self.rows_map:
+            self.rows_map.close()
+            self.rows_map = None
+
+
+class MappedHistory(StatsHistory):
+    # Read only StatsHistory on the column file of a stats directory. refresh()
+    # picks up the rows written since, and follows the new generations. The
+    # sparse metrics (with the _min/_max/_count of a sparse average) are
+    # queried from the segments, and so is everything when no column file can
+    # be mapped.
+    #
+    # build: the collector of the directory writes no column file (a fleet
+    # host), the viewer builds it from the segments, at open then at refresh.
+    def __init__(self, directory, build=False):
+        super().__init__(())
+        self.directory = directory
+        self.writer = None
+        self.segments = None
+        if build:
+            self.writer = ColumnWriter(directory)
+            last = self.writer.last_timestamp()
+            self.segments = SegmentReader(directory)
+            self.start = None if last is None else last + 1
+        self.path = None
+        self.rows_map = None
+        self.layout_length = None
+        self.slots = {}
+        self.sparse = set()
+        self.fallback = None
+        # Sparse metric -> its SegmentHistory, with the _min/_max/_count of a sparse average
+        self.extras = {}
+        self.refresh()
+
+    def append(self, sample):
+        raise TypeError("MappedHistory is read only, samples go through StatsStorage")
+
+    def trim(self, cutoff):
+        # The writer prunes the file
+        pass
+
+    def metric_names(self):
+        return set(self.columns) | self.sparse
+
+    def build(self):
+        for sample in self.segments.read(self.start):
+            self.writer.append(sample)
+        self.start = None
+        # Pruned with the segments
+        first = first_timestamp(self.directory)
+        if first is not None:
+            self.writer.prune(first)
+
+    def map(self, path):
+        # The generation at path, None and the segments instead when it cannot be mapped
+        self.path = path
+        self.rows_map = None
+        self.layout_length = None
+        if path is None:
+            return
+        try:
+            column_map = map_file(path)
+        except OSError as e:
+            print(f"Ignored stats columns of {self.directory} : {e}")
+            return
+        if column_map is not None:
+            self.rows_map = MappedRows(column_map)
+
+    def refresh(self):
+        if self.writer:
+            self.build()
+        path = latest_generation(self.directory)
+        if path != self.path:
+            # The old views stay valid for whoever still holds them, the map goes with the last one
+            self.map(path)
+        if self.rows_map is None:
+            if self.fallback is None:
+                self.fallback = SegmentHistory(self.directory)
+            else:
+                self.fallback.refresh()
+            self.timestamps = self.fallback.timestamps
+            self.columns = self.fallback.columns
+            self.trimmed = 0
+            return
+        self.fallback = None
+
+        rows = self.rows_map.words[ROWS]
+        if rows > self.rows_map.capacity:
+            # Grown by the writer since it was mapped
+            self.map(path)
+            if self.rows_map is None:
+                return self.refresh()
+            rows = min(rows, self.rows_map.capacity)
+        if self.rows_map.words[LAYOUT_LENGTH] != self.layout_length:
+            self.layout_length = self.rows_map.words[LAYOUT_LENGTH]
+            self.slots, sparse = parse_layout(self.rows_map.layout())
+            # Read from their slot while they have one
+            self.sparse = sparse - set(self.slots)
+        self.timestamps = self.rows_map.timestamps(rows)
+        self.columns = {metric: self.rows_map.column(slot, rows) for metric, slot in self.slots.items()}
+        self.trimmed = self.rows_map.base
+        for extra in self.extras.values():
+            extra.refresh()
+            # Pruned like the rows
+            if len(self.timestamps):
+                extra.trim(self.timestamps[0])
+
+    def from_segments(self, metric):
+        return metric not in self.columns and (metric in self.sparse or self.is_aggregate(metric))
+
+    def is_aggregate(self, metric):
+        # The _min, _max and _count of a sparse rollup average, sparse with it
+        return is_aggregate(metric, self.sparse)
+
+    def extra_history(self, metric):
+        # A metric without a column, read from the segments since the first row once, then followed
+        key = metric
+        metrics = {metric}
+        if self.is_aggregate(metric):
+            key = metric.rsplit("_", 1)[0]
+            metrics = {key} | {key + suffix for suffix in AGGREGATE_SUFFIXES}
+        if key not in self.extras:
+            start = self.timestamps[0] if len(self.timestamps) else None
+            self.extras[key] = SegmentHistory(self.directory, metrics, start)
+        return self.extras[key]
+
+    def query(self, metric, start, end, step=None):
+        if self.from_segments(metric):
+            return self.extra_history(metric).query(metric, start, end, step)
+        return super().query(metric, start, end, step)
+
+    def close(self):
+        # The map goes with the last view still held elsewhere
+        if self.writer:
+            self.writer.close()
+        self.rows_map = None
+        self.path = None
+        self.fallback = None
+        self.extras = {}
+        self.timestamps = array('q')
+        self.columns = {}
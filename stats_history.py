@@ -0,0 +1,106 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+METRICS = ("cpu", "ram", "temp", "disk")
+NAN = float('nan')
+
+# Format of QDateTime.toString(), used by the samples written before the epoch timestamps
+LEGACY_TIMESTAMP_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.strptime(value, LEGACY_TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+class StatsHistory:
+    # Columnar history: one epoch seconds column and one typed column per metric.
+    # Missing values are stored as NaN so all the columns keep the same length.
+    def __init__(self, metrics=METRICS):
+        self.timestamps = array('q')
+        self.columns = {metric: array('d') for metric in metrics}
+        # Number of samples dropped from the head by trim, so followers can keep absolute positions
+        self.trimmed = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add_column(self, metric):
+        column = array('d', [NAN]) * len(self.timestamps)
+        self.columns[metric] = column
+        return column
+
+    def append(self, sample):
+        timestamp = parse_timestamp(sample.get("timestamp"))
+        if timestamp is None:
+            return
+        for metric, value in sample.items():
+            if metric != "timestamp" and metric not in self.columns and isinstance(value, (int, float)):
+                self.add_column(metric)
+        # Keep the timestamps sorted for the binary searches, even if the clock went backwards
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self.timestamps.append(timestamp)
+        for metric, column in self.columns.items():
+            value = sample.get(metric)
+            column.append(float(value) if isinstance(value, (int, float)) else NAN)
+
+    def extend(self, samples):
+        for sample in samples:
+            self.append(sample)
+
+    def metric_names(self):
+        return set(self.columns)
+
+    def refresh(self):
+        # Nothing to pick up, the samples are appended to this history directly
+        pass
+
+    def trim(self, cutoff):
+        # Drop the samples older than cutoff
+        count = bisect_left(self.timestamps, cutoff)
+        if not count:
+            return
+        del self.timestamps[:count]
+        for column in self.columns.values():
+            del column[:count]
+        self.trimmed += count
+
+    def timestamps_view(self, start=0, end=None):
+        return memoryview(self.timestamps)[start:end]
+
+    # Zero copy slices. An array cannot grow while a view on it is alive,
+    # so the views must be released before the next append.
+    def column_view(self, metric, start=0, end=None):
+        return memoryview(self.columns[metric])[start:end]
+
+    def index_range(self, start, end):
+        return bisect_left(self.timestamps, start), bisect_right(self.timestamps, end)
+
+    def query(self, metric, start, end, step=None):
+        # Samples of a metric between start and end (epoch seconds, inclusive).
+        # Without a step this returns zero copy views, with a step it keeps the
+        # first sample of every step long bucket. Both cost O(log n + result).
+        if metric not in self.columns:
+            return array('q'), array('d')
+        lo, hi = self.index_range(start, end)
+        if not step or step <= 1:
+            return self.timestamps_view(lo, hi), self.column_view(metric, lo, hi)
+
+        column = self.columns[metric]
+        timestamps = array('q')
+        values = array('d')
+        i = lo
+        while i < hi:
+            timestamp = self.timestamps[i]
+            timestamps.append(timestamp)
+            values.append(column[i])
+            # Jump to the first sample of the next bucket
+            next_bucket = start + ((timestamp - start) // step + 1) * step
+            i = bisect_left(self.timestamps, next_bucket, i + 1, hi)
+        return timestamps, values
@@ -0,0 +1,191 @@
+import fnmatch
+import math
+import os
+import time
+from stats_storage import StatsStorage, read_stats, last_sample
+from stats_history import parse_timestamp
+from sketches import DDSketch, SKETCH_TIERS
+
+RAW_TIER = "raw"
+
+# (name, bucket size, retention) in seconds
+DEFAULT_TIERS = [
+    ("1m", 60, 30 * 24 * 3600),
+    ("1h", 3600, 365 * 24 * 3600),
+]
+DEFAULT_RAW_RETENTION = 24 * 3600
+# Metrics with quantile sketches unless sketch_metrics is set, fnmatch patterns
+DEFAULT_SKETCH_METRICS = ["cpu", "ram", "temp", "temp.*", "disk", "disk.*", "disk_percent", "disk_percent.*",
+                          "swap", "load1", "net_recv", "net_sent", "disk_read", "disk_write"]
+# Longest gap a value is weighted with, beyond it the sampling was stopped
+SKETCH_MAX_GAP = 300
+
+
+def configured_tiers(config):
+    # Every tier as (name, bucket, retention), raw first with the sampling interval as bucket
+    raw = (RAW_TIER, config.get("check_interval", 5), config.get("raw_retention", DEFAULT_RAW_RETENTION))
+    return [raw] + [tuple(tier) for tier in config.get("rollup_tiers", DEFAULT_TIERS)]
+
+
+def tier_directory(stats_directory, name):
+    if name == RAW_TIER:
+        return stats_directory
+    return os.path.join(stats_directory, name)
+
+
+def choose_tier(tiers, start, end, min_points, now=None):
+    # Coarsest tier that still gives min_points on the range and keeps data back to
+    # its start. tiers is a list of (name, bucket, retention), raw first.
+    now = now if now is not None else time.time()
+    for name, bucket, retention in reversed(tiers):
+        if (end - start) / bucket >= min_points and now - retention <= start:
+            return name
+    # Otherwise the finest tier that covers the range, or the one that keeps the most
+    for name, bucket, retention in tiers:
+        if now - retention <= start:
+            return name
+    return max(tiers, key=lambda tier: tier[2])[0]
+
+
+class RollupTier:
+    def __init__(self, name, bucket, retention):
+        self.name = name
+        self.bucket = bucket
+        self.retention = retention
+        self.storage = None
+        self.resume = 0
+        self.bucket_start = None
+        self.aggregates = {}
+        self.max_gap = bucket
+        # The averages go to the column file of the viewers
+        self.mapped = True
+        # Time of the previous value of each metric. With adaptive sampling the
+        # samples are not evenly spaced: the average weighs each value by the gap
+        # before it, the time it was measured over (cpu_percent is a mean since its previous call).
+        self.last_seen = {}
+
+    def add(self, timestamp, sample):
+        if timestamp < self.resume:
+            return
+        bucket_start = timestamp - timestamp % self.bucket
+        if bucket_start != self.bucket_start:
+            self.emit()
+            self.bucket_start = bucket_start
+
+        for metric, value in sample.items():
+            if metric == "timestamp" or not isinstance(value, (int, float)) or math.isnan(value):
+                continue
+            last = self.last_seen.get(metric)
+            weight = min(max(timestamp - last, 1), self.max_gap) if last is not None else 1
+            self.last_seen[metric] = timestamp
+            self.accumulate(metric, value, weight)
+
+    def accumulate(self, metric, value, weight):
+        aggregate = self.aggregates.get(metric)
+        if aggregate is None:
+            self.aggregates[metric] = [value, value, value * weight, 1, weight]
+        else:
+            if value < aggregate[0]:
+                aggregate[0] = value
+            if value > aggregate[1]:
+                aggregate[1] = value
+            aggregate[2] += value * weight
+            aggregate[3] += 1
+            aggregate[4] += weight
+
+    def emit(self):
+        if self.bucket_start is None or not self.aggregates:
+            return
+        # The average stays under the metric name, so a tier reads like the raw history
+        record = {"timestamp": self.bucket_start}
+        for metric, (minimum, maximum, total, count, weight) in self.aggregates.items():
+            record[metric] = total / weight
+            record[f"{metric}_min"] = minimum
+            record[f"{metric}_max"] = maximum
+            record[f"{metric}_count"] = count
+        self.storage.append(record)
+        self.aggregates = {}
+
+
+class SketchTier(RollupTier):
+    # A quantile sketch (sketches.DDSketch) of each metric per bucket, the
+    # values weighted by their gap like the rollup average. Stored as one
+    # record per bucket, {metric: sketch as a dict}.
+    def __init__(self, name, bucket, retention, metrics):
+        super().__init__(name, bucket, retention)
+        self.max_gap = min(bucket, SKETCH_MAX_GAP)
+        self.mapped = False
+        self.metrics = metrics
+        # Metric -> whether it matches a pattern of metrics
+        self.sketched = {}
+
+    def accumulate(self, metric, value, weight):
+        sketched = self.sketched.get(metric)
+        if sketched is None:
+            sketched = self.sketched[metric] = any(fnmatch.fnmatchcase(metric, pattern) for pattern in self.metrics)
+        if not sketched:
+            return
+        sketch = self.aggregates.get(metric)
+        if sketch is None:
+            sketch = self.aggregates[metric] = DDSketch()
+        sketch.add(value, weight)
+
+    def emit(self):
+        if self.bucket_start is None or not self.aggregates:
+            return
+        record = {"timestamp": self.bucket_start}
+        for metric, sketch in self.aggregates.items():
+            record[metric] = sketch.to_dict()
+        self.storage.append(record)
+        self.aggregates = {}
+
+
+class Downsampler:
+    # Keeps the rollup tiers of the raw history up to date, one sample at a time,
+    # and the sketch tiers the summaries read. The bucket being filled is not
+    # written on exit, it is rebuilt from the raw samples on the next start.
+    def __init__(self, storage, tiers, sketch_metrics=None):
+        self.storage = storage
+        self.raw_retention = tiers[0][2]
+        self.tiers = [RollupTier(name, bucket, retention) for name, bucket, retention in tiers[1:]]
+        metrics = DEFAULT_SKETCH_METRICS if sketch_metrics is None else sketch_metrics
+        if metrics:
+            self.tiers += [SketchTier(name, bucket, retention, metrics) for name, bucket, retention in SKETCH_TIERS]
+        for tier in self.tiers:
+            tier.storage = StatsStorage(tier_directory(storage.directory, tier.name),
+                                        flush_interval=storage.flush_interval,
+                                        columns=tier.mapped and storage.columns is not None)
+            last = last_sample(tier.storage.directory)
+            if last:
+                tier.resume = parse_timestamp(last["timestamp"]) + tier.bucket
+        self.backfill()
+
+    def backfill(self):
+        # Roll up the raw samples written since the last stored bucket of each tier
+        if not self.tiers:
+            return
+        start = min(tier.resume for tier in self.tiers)
+        self.storage.flush()
+        for sample in read_stats(self.storage.directory, start=start):
+            self.add(sample)
+
+    def add(self, sample):
+        timestamp = parse_timestamp(sample.get("timestamp"))
+        if timestamp is None:
+            return
+        for tier in self.tiers:
+            tier.add(timestamp, sample)
+
+    def prune(self, now=None):
+        now = now if now is not None else time.time()
+        self.storage.prune(now - self.raw_retention)
+        for tier in self.tiers:
+            tier.storage.prune(now - tier.retention)
+
+    def flush(self):
+        for tier in self.tiers:
+            tier.storage.flush()
+
+    def close(self):
+        for tier in self.tiers:
+            tier.storage.close()
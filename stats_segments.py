@@ -0,0 +1,179 @@
+import json
+import os
+from stats_history import StatsHistory, parse_timestamp
+from stats_blocks import read_blocks, read_index
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.ndjson'
+# A closed segment is compacted into a compressed block file (stats_blocks)
+BLOCKS_SUFFIX = '.blocks'
+
+
+def segment_paths(directory):
+    if not os.path.isdir(directory):
+        return []
+    paths = {}
+    for name in os.listdir(directory):
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        if name.endswith(BLOCKS_SUFFIX):
+            paths[name[:-len(BLOCKS_SUFFIX)]] = name
+        elif name.endswith(SEGMENT_SUFFIX):
+            # Both while a segment is being compacted, the block file wins
+            paths.setdefault(name[:-len(SEGMENT_SUFFIX)], name)
+    # Segment names carry a zero padded start time, so the name order is the time order
+    return [os.path.join(directory, paths[key]) for key in sorted(paths)]
+
+
+def segment_key(path):
+    # The same for a segment and the block file it is compacted into
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def segment_start(path):
+    return int(segment_key(path)[len(SEGMENT_PREFIX):])
+
+
+def parse_lines(data):
+    samples = []
+    for line in data.splitlines():
+        try:
+            samples.append(json.loads(line))
+        except ValueError:
+            continue
+    return samples
+
+
+def read_segment(path, start=None):
+    if path.endswith(BLOCKS_SUFFIX):
+        return read_blocks(path, start)
+    with open(path, 'rb') as file:
+        data = file.read()
+    # A torn last record has no newline, it is skipped until the writer recovers it
+    return parse_lines(data[:data.rfind(b'\n') + 1])
+
+
+def read_stats(directory, start=None):
+    # Read only access for the viewers, never repairs or touches the segments.
+    # With a start time, the segments that end before it are not read at all.
+    paths = segment_paths(directory)
+    samples = []
+    for i, path in enumerate(paths):
+        if start is not None and i + 1 < len(paths) and segment_start(paths[i + 1]) <= start:
+            continue
+        samples.extend(read_segment(path, start))
+    return samples
+
+
+def first_timestamp(directory):
+    # Timestamp of the oldest sample kept, from the block index or the first line
+    for path in segment_paths(directory):
+        with open(path, 'rb') as file:
+            if path.endswith(BLOCKS_SUFFIX):
+                index = read_index(file)
+                if index:
+                    return index[0][2]
+                continue
+            for sample in parse_lines(file.readline()):
+                timestamp = parse_timestamp(sample.get("timestamp"))
+                if timestamp is not None:
+                    return timestamp
+    return None
+
+
+def last_sample(directory):
+    paths = segment_paths(directory)
+    for path in reversed(paths):
+        samples = read_segment(path)
+        if samples:
+            return samples[-1]
+    return None
+
+
+class SegmentReader:
+    # Incremental read of a stats directory: read() returns the samples written
+    # since the previous call. A closed segment is read once, the active one
+    # from the byte offset where the previous read stopped, and a segment
+    # compacted meanwhile is not read again. With metrics, the samples only
+    # keep those (the block files decode nothing else) and the samples without
+    # any of them are left out.
+    def __init__(self, directory, metrics=None):
+        self.directory = directory
+        self.metrics = metrics
+        # Segment key -> byte offset and number of samples read from its NDJSON file
+        self.offsets = {}
+        self.counts = {}
+        self.closed = set()
+
+    def read(self, start=None):
+        paths = segment_paths(self.directory)
+        samples = []
+        for i, path in enumerate(paths):
+            key = segment_key(path)
+            if key in self.closed:
+                continue
+            active = i + 1 == len(paths)
+            if start is not None and not active and key not in self.counts and segment_start(paths[i + 1]) <= start:
+                self.closed.add(key)
+                continue
+            if path.endswith(BLOCKS_SUFFIX):
+                count = self.counts.get(key)
+                new = read_blocks(path, start if count is None else None, self.metrics)
+                # Compacted after a part of it was read as NDJSON
+                if count:
+                    new = new[count:]
+                self.closed.add(key)
+            else:
+                new = self.read_lines(path, key)
+                if not active:
+                    self.closed.add(key)
+            samples.extend(self.select(new, start))
+        # Forget the pruned segments
+        keys = {segment_key(path) for path in paths}
+        self.closed &= keys
+        for key in set(self.offsets) - keys:
+            del self.offsets[key]
+            del self.counts[key]
+        return samples
+
+    def read_lines(self, path, key):
+        offset = self.offsets.get(key, 0)
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        end = data.rfind(b'\n') + 1
+        # Counted like the block file will have them, without the samples it drops
+        new = [sample for sample in parse_lines(data[:end]) if parse_timestamp(sample.get("timestamp")) is not None]
+        self.offsets[key] = offset + end
+        self.counts[key] = self.counts.get(key, 0) + len(new)
+        return new
+
+    def select(self, samples, start):
+        if start is None and self.metrics is None:
+            return samples
+        selected = []
+        for sample in samples:
+            timestamp = parse_timestamp(sample.get("timestamp"))
+            if timestamp is None or (start is not None and timestamp < start):
+                continue
+            if self.metrics is not None:
+                sample = {metric: sample[metric] for metric in self.metrics if metric in sample}
+                if not sample:
+                    continue
+                sample["timestamp"] = timestamp
+            selected.append(sample)
+        return selected
+
+
+class SegmentHistory(StatsHistory):
+    # StatsHistory read from the segments of a stats directory, refresh()
+    # appends the samples written since. For the metrics without a mapped
+    # column, and for the viewers when the column files cannot be mapped.
+    def __init__(self, directory, metrics=None, start=None):
+        super().__init__(())
+        self.reader = SegmentReader(directory, metrics)
+        self.start = start
+        self.refresh()
+
+    def refresh(self):
+        self.extend(self.reader.read(self.start))
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from stats_history import parse_timestamp
+from stats_blocks import write_blocks
+from stats_columns import ColumnWriter
+from stats_segments import (SEGMENT_PREFIX, SEGMENT_SUFFIX, BLOCKS_SUFFIX, segment_paths, segment_start,
+                            read_segment, read_stats, last_sample)
+from diagnostics import diagnostics
+
+STATS_DIR = 'sentinel_stats'
+LEGACY_STATS_FILE = 'sentinel_stats.json'
+
+
+class StatsStorage:
+    # columns: keep the column file of the viewers (stats_columns) up to date,
+    # off for the fleet hosts, whose viewer builds it when it opens them
+    def __init__(self, directory=STATS_DIR, segment_max_bytes=4 * 1024 * 1024,
+                 segment_max_age=24 * 3600, flush_interval=10, columns=True):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.flush_interval = flush_interval
+
+        self.buffer = []
+        self.segment = None
+        self.segment_size = 0
+        self.segment_start = 0
+        self.last_flush = time.monotonic()
+        # The closed segments are compacted by a worker thread, the lock keeps prune() off the one being compacted
+        self.compactor = None
+        self.compact_lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.recover()
+        self.import_legacy()
+        # Segments closed before a crash, or written before the block files
+        self.start_compaction()
+        self.columns = ColumnWriter(self.directory) if columns else None
+        if self.columns:
+            self.sync_columns()
+
+    def recover(self):
+        # Cut a record torn by a crash during the last write, all the records before it stay valid
+        paths = segment_paths(self.directory)
+        if not paths or not paths[-1].endswith(SEGMENT_SUFFIX):
+            return
+        path = paths[-1]
+        with open(path, 'rb+') as file:
+            data = file.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                file.truncate(end)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def import_legacy(self):
+        # Move the old single JSON file into the first segment
+        if not os.path.exists(LEGACY_STATS_FILE) or segment_paths(self.directory):
+            return
+        try:
+            with open(LEGACY_STATS_FILE, 'r') as file:
+                all_stats = json.load(file)
+        except ValueError:
+            return
+        self.buffer.extend(self.encode(stats) for stats in all_stats)
+        self.flush()
+        os.replace(LEGACY_STATS_FILE, LEGACY_STATS_FILE + '.bak')
+
+    def encode(self, stats):
+        return json.dumps(stats, separators=(',', ':')) + '\n'
+
+    def open_segment(self):
+        self.close_segment()
+        self.segment_start = max(int(time.time()), self.segment_start + 1)
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.segment_start:012d}{SEGMENT_SUFFIX}")
+        self.segment = open(path, 'ab')
+        self.segment_size = self.segment.tell()
+
+    def open_last_segment(self):
+        paths = segment_paths(self.directory)
+        if not paths or not paths[-1].endswith(SEGMENT_SUFFIX):
+            self.open_segment()
+            return
+        path = paths[-1]
+        self.segment_start = segment_start(path)
+        self.segment = open(path, 'ab')
+        self.segment_size = self.segment.tell()
+
+    def close_segment(self):
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+
+    def should_roll(self, pending):
+        if self.segment_size and self.segment_size + pending > self.segment_max_bytes:
+            return True
+        return time.time() - self.segment_start >= self.segment_max_age
+
+    def sync_columns(self):
+        # The column file is written at each sample but never fsynced, the
+        # segments are the reference: after a crash the columns lose the rows
+        # the segments lack (the buffer that was not flushed), then get the
+        # samples they miss, all of them the first time.
+        last_stats = last_sample(self.directory)
+        self.columns.truncate(parse_timestamp(last_stats.get("timestamp")) if last_stats else None)
+        last = self.columns.last_timestamp()
+        for stats in read_stats(self.directory, None if last is None else last + 1):
+            timestamp = parse_timestamp(stats.get("timestamp"))
+            if last is None or (timestamp is not None and timestamp > last):
+                self.columns.append(stats)
+
+    def append(self, stats):
+        with diagnostics.timer("storage.append"):
+            # The segment buffer first, the columns never get ahead of it
+            self.buffer.append(self.encode(stats))
+            if self.columns:
+                self.columns.append(stats)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        # Group commit: every buffered record goes out in one write and one fsync
+        with diagnostics.timer("storage.flush"):
+            self.last_flush = time.monotonic()
+            if not self.buffer:
+                return
+            data = ''.join(self.buffer).encode()
+            self.buffer = []
+            if not self.segment:
+                self.open_last_segment()
+            if self.should_roll(len(data)):
+                self.open_segment()
+                self.start_compaction()
+            self.segment.write(data)
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+            self.segment_size += len(data)
+
+    def start_compaction(self):
+        # The readers take the block file once it is renamed in place, the segment until then
+        if self.compactor and self.compactor.is_alive():
+            return
+        self.compactor = threading.Thread(target=self.compact_closed, daemon=True)
+        self.compactor.start()
+
+    def compact_closed(self):
+        # Every closed segment still in NDJSON, the last one is the active segment.
+        # A segment rolled meanwhile is left to the next roll or the next start.
+        for path in segment_paths(self.directory)[:-1]:
+            if not path.endswith(SEGMENT_SUFFIX):
+                continue
+            with self.compact_lock:
+                try:
+                    if os.path.exists(path):
+                        self.compact(path)
+                except OSError as e:
+                    print(f"Ignored compaction of {path} : {e}")
+
+    def compact(self, path):
+        # A closed segment is rewritten as compressed blocks, about 15 times smaller
+        with diagnostics.timer("storage.compact"):
+            blocks = path[:-len(SEGMENT_SUFFIX)] + BLOCKS_SUFFIX
+            write_blocks(blocks, read_segment(path))
+            os.remove(path)
+
+    def prune(self, cutoff):
+        # Delete the segments whose records are all older than cutoff, the last one is always kept
+        with self.compact_lock:
+            paths = segment_paths(self.directory)
+            for path, next_path in zip(paths, paths[1:]):
+                if segment_start(next_path) <= cutoff:
+                    os.remove(path)
+        if self.columns:
+            self.columns.prune(cutoff)
+
+    def read_all(self):
+        self.flush()
+        return read_stats(self.directory)
+
+    def close(self):
+        self.flush()
+        self.close_segment()
+        if self.compactor:
+            self.compactor.join()
+        if self.columns:
+            self.columns.close()
@@ -1,43 +1,96 @@
-from PySide6.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QPushButton
+from PySide6.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QPushButton, QLabel, QComboBox, QDateTimeEdit)
 from PySide6.QtGui import QIcon
-from PySide6.QtCore import QTimer, Qt, QDateTime
-from PySide6.QtCharts import QChart, QChartView, QLineSeries, QValueAxis
+from PySide6.QtCore import QTimer, Qt, QDateTime, QPointF
+from PySide6.QtCharts import QChart, QChartView, QLineSeries, QValueAxis, QDateTimeAxis
 import json
+import math
 import os
+from stats_storage import STATS_DIR
+from stats_columns import MappedHistory
+from stats_rollup import configured_tiers, choose_tier, tier_directory, RAW_TIER
+from decimation import decimate
+from metric_sources import chart_metrics
+from diagnostics import diagnostics
+from summary_panel import SummaryPanel
 
-STATS_FILE = 'sentinel_stats.json'
 CONFIG_FILE = 'sentinel_config.json'
 
+# Selectable time ranges, in seconds. None is the custom range.
+RANGES = [
+    ("15 min", 15 * 60),
+    ("1 h", 3600),
+    ("24 h", 24 * 3600),
+    ("7 d", 7 * 24 * 3600),
+    ("Custom", None),
+]
+
+# A rollup tier is used when it still gives this many points on the range
+MIN_POINTS = 300
+
+
+def axis_format(span):
+    if span <= 24 * 3600:
+        return "HH:mm"
+    return "dd/MM HH:mm"
+
 class StatsWindow(QMainWindow):
-    def __init__(self):
+    # The tiers are read from the column files of stats_dir, mapped in memory
+    # when the window first needs them: opening costs the range shown, and the
+    # window follows the samples that the storage appends to them. Another
+    # stats_dir for the hosts of the fleet, with build_columns as their
+    # collector writes no column files.
+    def __init__(self, stats_dir=STATS_DIR, title="Statistics", build_columns=False):
         super().__init__()
-        self.setWindowTitle("Statistics")
+        self.setWindowTitle(title)
+        self.stats_dir = stats_dir
+        self.build_columns = build_columns
         self.setWindowIcon(QIcon("sentinelle.png"))
         self.setGeometry(100, 100, 800, 600)
 
         layout = QVBoxLayout()
 
-        # Buttons for displa diferents statistic
-        self.cpu_button = QPushButton("Display CPU statistics")
-        self.cpu_button.clicked.connect(self.show_cpu_stats)
-        layout.addWidget(self.cpu_button)
-
-        self.ram_button = QPushButton("Display RAM statistics")
-        self.ram_button.clicked.connect(self.show_ram_stats)
-        layout.addWidget(self.ram_button)
-
-        self.temp_button = QPushButton("Display temperature statistics")
-        self.temp_button.clicked.connect(self.show_temp_stats)
-        layout.addWidget(self.temp_button)
-
-        self.disk_button = QPushButton("Display disk statistics")
-        self.disk_button.clicked.connect(self.show_disk_stats)
-        layout.addWidget(self.disk_button)
+        # Buttons for displa diferents statistic, one per metric declared by the sources
+        self.chart_metrics = chart_metrics()
+        for metric, title, y_label in self.chart_metrics:
+            button = QPushButton(f"Display {title} statistics")
+            button.clicked.connect(lambda checked=False, metric=metric, title=title, y_label=y_label: self.show_metric(metric, title, y_label))
+            layout.addWidget(button)
+
+        # Every other stored metric (each temperature sensor...)
+        other_layout = QHBoxLayout()
+        other_layout.addWidget(QLabel("Other metric:"))
+        self.other_combo = QComboBox()
+        self.other_combo.textActivated.connect(lambda metric: self.show_metric(metric, metric, metric))
+        other_layout.addWidget(self.other_combo)
+        layout.addLayout(other_layout)
+
+        # Time range selection
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel("Time range:"))
+        self.range_combo = QComboBox()
+        self.range_combo.addItems([name for name, _ in RANGES])
+        self.range_combo.setCurrentText("1 h")
+        self.range_combo.currentIndexChanged.connect(self.range_changed)
+        range_layout.addWidget(self.range_combo)
+
+        now = QDateTime.currentDateTime()
+        self.start_edit = QDateTimeEdit(now.addSecs(-3600))
+        self.end_edit = QDateTimeEdit(now)
+        for edit in (self.start_edit, self.end_edit):
+            edit.setCalendarPopup(True)
+            edit.setVisible(False)
+            edit.dateTimeChanged.connect(self.range_changed)
+            range_layout.addWidget(edit)
+        layout.addLayout(range_layout)
 
         # Creating the chart view
         self.chart_view = QChartView()
         layout.addWidget(self.chart_view)
 
+        # Quantiles of the metric shown over the last hour, day and week
+        self.summary_panel = SummaryPanel(self.stats_dir, {})
+        layout.addWidget(self.summary_panel)
+
         # Central Widget
         central_widget = QWidget()
         central_widget.setLayout(layout)
@@ -48,167 +101,253 @@ class StatsWindow(QMainWindow):
         self.update_timer.timeout.connect(self.update_graph)
         self.update_timer.start(1000)  # Update every seconds
 
+        # The summary moves slower than the chart
+        self.summary_timer = QTimer()
+        self.summary_timer.timeout.connect(self.summary_panel.refresh)
+        self.summary_timer.start(30 * 1000)
+
+        # Redraw for the new width once the resizing is over
+        self.resize_timer = QTimer()
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self.redraw)
+
         self.current_series = None
         self.current_series_name = ""
-        self.data = {
-            "cpu": [],
-            "ram": [],
-            "temp": [],
-            "disk": [],
-            "timestamps": []
-        }
+        self.current_show = None
+        self.current_tier = None
+        self.axis_x = None
+        self.axis_y = None
+        self.shown_until = 0
+        # Samples at shown_until already on the chart, several when they share a second
+        self.shown_at_last = 0
+        self.y_min = math.inf
+        self.y_max = -math.inf
+        self.config = {}
+        self.histories = {}
         self.temp_unit = "Celsius (°C)"
-        self.load_stats()
         self.load_config()
+        self.summary_panel.config = self.config
+        self.tiers = configured_tiers(self.config)
+        self.other_combo.addItems(self.other_metrics())
+
+    def history(self, tier):
+        # The history of a tier, raw samples or a rollup, mapped the first time it is shown
+        if tier not in self.histories:
+            self.histories[tier] = MappedHistory(tier_directory(self.stats_dir, tier), self.build_columns)
+        return self.histories[tier]
 
-    def load_stats(self):
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as file:
-                all_stats = json.load(file)
-
-                # Initialize lists
-                timestamps = []
-                cpu = []
-                ram = []
-                temp = []
-                disk = []
-
-                for stat in all_stats:
-                    timestamp = QDateTime.fromString(stat["timestamp"], "ddd MMM d HH:mm:ss yyyy")
-                    if "cpu" in stat:
-                        timestamps.append(timestamp)
-                        cpu.append(stat["cpu"])
-                    if "ram" in stat:
-                        ram.append(stat["ram"])
-                    if "temp" in stat:
-                        temp.append(stat["temp"])
-                    if "disk" in stat:
-                        disk.append(stat["disk"])
-
-                # Align all lists to the length of timestamps
-                min_length = len(timestamps)
-
-                self.data["timestamps"] = timestamps[:min_length]
-                self.data["cpu"] = cpu[:min_length]
-                self.data["ram"] = ram[:min_length]
-                self.data["temp"] = temp[:min_length]
-                self.data["disk"] = disk[:min_length]
+    def other_metrics(self):
+        # The rollups have the metrics of the raw samples
+        charted = {metric for metric, _, _ in self.chart_metrics}
+        return sorted(self.history(RAW_TIER).metric_names() - charted)
 
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as file:
-                config = json.load(file)
-                self.temp_unit = config.get("temperature_unit", "Celsius (°C)")
-
-    def filter_last_hour_data(self):
-        current_time = QDateTime.currentDateTime()
-        one_hour_ago = current_time.addSecs(-3600)
-
-        filtered_data = {
-            "timestamps": [],
-            "cpu": [],
-            "ram": [],
-            "temp": [],
-            "disk": []
-        }
-
-        for i, timestamp in enumerate(self.data["timestamps"]):
-            if timestamp >= one_hour_ago:
-                # Check if index is valid for all lists
-                if (i < len(self.data["cpu"]) and
-                    i < len(self.data["ram"]) and
-                    i < len(self.data["temp"]) and
-                    i < len(self.data["disk"])):
-                    filtered_data["timestamps"].append(timestamp)
-                    filtered_data["cpu"].append(self.data["cpu"][i])
-                    filtered_data["ram"].append(self.data["ram"][i])
-                    filtered_data["temp"].append(self.data["temp"][i])
-                    filtered_data["disk"].append(self.data["disk"][i])
-
-        return filtered_data
-
-    def convert_timestamps_to_minutes(self, timestamps):
-        current_time = QDateTime.currentDateTime()
-        return [(current_time.toSecsSinceEpoch() - timestamp.toSecsSinceEpoch()) / 60 for timestamp in timestamps]
-
-    def show_cpu_stats(self):
-        filtered_data = self.filter_last_hour_data()
-        x_data = self.convert_timestamps_to_minutes(filtered_data["timestamps"])
-        self.show_chart("CPU", "CPU utilisation(%)", x_data, filtered_data["cpu"], "cpu")
-
-    def show_ram_stats(self):
-        filtered_data = self.filter_last_hour_data()
-        x_data = self.convert_timestamps_to_minutes(filtered_data["timestamps"])
-        self.show_chart("RAM", "RAM utilisation(%)", x_data, filtered_data["ram"], "ram")
-
-    def show_temp_stats(self):
-        filtered_data = self.filter_last_hour_data()
-        x_data = self.convert_timestamps_to_minutes(filtered_data["timestamps"])
-        if self.temp_unit == "Fahrenheit (°F)":
-            temp_data = [self.celsius_to_fahrenheit(temp) for temp in filtered_data["temp"]]
-            y_label = "Temperature (°F)"
-        else:
-            temp_data = filtered_data["temp"]
-            y_label = "Temperature (°C)"
-
-        self.show_chart("Temperature", y_label, x_data, temp_data, "temp")
-
-    def show_disk_stats(self):
-        filtered_data = self.filter_last_hour_data()
-        x_data = self.convert_timestamps_to_minutes(filtered_data["timestamps"])
-        self.show_chart("Disk", "Free space disk (Go)", x_data, filtered_data["disk"], "disk")
-
-    def show_chart(self, title, y_label, x_data, y_data, series_name):
-        chart = QChart()
-        series = QLineSeries()
-        series.setName(series_name)
-
-        for x, y in zip(x_data, y_data):
-            series.append(x, y)
-
-        chart.addSeries(series)
-
-        # Create an X axis based on minutes
-        axis_x = QValueAxis()
-        axis_x.setRange(0, 60)  # 0 to 60 minutes
-        axis_x.setTickCount(7)  # MArkers at 0, 10, 20, 30, 40, 50, 60
-        axis_x.setTitleText("Minutes")
-        chart.addAxis(axis_x, Qt.AlignBottom)
-        series.attachAxis(axis_x)
-
-        # Create Y axis
-        axis_y = QValueAxis()
-        axis_y.setTitleText(y_label)
-        chart.addAxis(axis_y, Qt.AlignLeft)
-        series.attachAxis(axis_y)
-
-        # Legende
-        chart.legend().setVisible(True)
-        chart.legend().setAlignment(Qt.AlignBottom)
-
-        chart.setTitle(title)
-        self.chart_view.setChart(chart)
-        self.current_series = series
-        self.current_series_name = series_name
-
-    def update_graph(self):
-        if not self.current_series:
-            return
-
-        # Check if datas are available
-        if self.current_series_name not in self.data:
+                self.config = json.load(file)
+                self.temp_unit = self.config.get("temperature_unit", "Celsius (°C)")
+
+    def is_custom_range(self):
+        return RANGES[self.range_combo.currentIndex()][1] is None
+
+    def current_range(self):
+        if self.is_custom_range():
+            start = self.start_edit.dateTime().toSecsSinceEpoch()
+            end = self.end_edit.dateTime().toSecsSinceEpoch()
+            return start, max(start + 1, end)
+        end = QDateTime.currentSecsSinceEpoch()
+        return end - RANGES[self.range_combo.currentIndex()][1], end
+
+    def range_changed(self):
+        custom = self.is_custom_range()
+        self.start_edit.setVisible(custom)
+        self.end_edit.setVisible(custom)
+        self.redraw()
+
+    def redraw(self):
+        if self.current_show:
+            self.current_show()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resize_timer.start(200)
+
+    def chart_width(self):
+        return max(self.chart_view.viewport().width(), 100)
+
+    def to_points(self, metric, timestamps, values, width=None):
+        fahrenheit = (metric == "temp" or metric.startswith("temp.")) and self.temp_unit == "Fahrenheit (°F)"
+        xs = []
+        ys = []
+        for timestamp, value in zip(timestamps, values):
+            if math.isnan(value):
+                continue
+            if fahrenheit:
+                value = self.celsius_to_fahrenheit(value)
+            xs.append(timestamp * 1000)
+            ys.append(value)
+        # Never more points than the chart has pixel columns
+        if width:
+            xs, ys = decimate(xs, ys, width, self.config.get("chart_decimation", "minmax"))
+        return [QPointF(x, y) for x, y in zip(xs, ys)]
+
+    def query_line(self, history, metric, start, end):
+        # On a rollup tier the line goes through the lowest then the highest sample
+        # of each bucket, the decimation keeps both: a spike shows like on the raw tier.
+        # The buckets without them (stored before they were mapped) keep their average.
+        timestamps, values = history.query(metric, start, end)
+        if self.current_tier == RAW_TIER:
+            return timestamps, values
+        _, lows = history.query(f"{metric}_min", start, end)
+        _, highs = history.query(f"{metric}_max", start, end)
+        if len(lows) != len(timestamps) or len(highs) != len(timestamps):
+            return timestamps, values
+        xs = []
+        ys = []
+        for timestamp, value, low, high in zip(timestamps, values, lows, highs):
+            if math.isnan(low) or math.isnan(high):
+                low = high = value
+            xs += (timestamp, timestamp)
+            ys += (low, high)
+        return xs, ys
+
+    def query_data(self, metric):
+        start, end = self.current_range()
+        self.current_tier = choose_tier(self.tiers, start, end, MIN_POINTS)
+        history = self.history(self.current_tier)
+        history.refresh()
+        timestamps, values = self.query_line(history, metric, start, end)
+        # Everything already in the history is on the chart, update_graph only adds what follows
+        self.shown_until = start - 1
+        self.shown_at_last = 0
+        self.mark_shown(timestamps)
+        return self.to_points(metric, timestamps, values, self.chart_width())
+
+    def mark_shown(self, timestamps):
+        if not len(timestamps):
             return
-
-        filtered_data = self.filter_last_hour_data()
-        x_data = self.convert_timestamps_to_minutes(filtered_data["timestamps"])
-        if self.current_series_name == "temp" and self.temp_unit == "Fahrenheit (°F)":
-            y_data = [self.celsius_to_fahrenheit(temp) for temp in filtered_data["temp"]]
+        last = timestamps[-1]
+        count = 0
+        while count < len(timestamps) and timestamps[len(timestamps) - 1 - count] == last:
+            count += 1
+        if last == self.shown_until:
+            self.shown_at_last += count
         else:
-            y_data = filtered_data[self.current_series_name]
+            self.shown_until = last
+            self.shown_at_last = count
+
+    def show_metric(self, metric, title, y_label):
+        if metric == "temp" or metric.startswith("temp."):
+            if self.temp_unit == "Fahrenheit (°F)":
+                y_label = "Temperature (°F)"
+            else:
+                y_label = "Temperature (°C)"
+
+        self.show_chart(title, y_label, metric)
+        self.current_show = lambda: self.show_metric(metric, title, y_label)
+        fahrenheit = (metric == "temp" or metric.startswith("temp.")) and self.temp_unit == "Fahrenheit (°F)"
+        self.summary_panel.show_metric(metric, self.history(RAW_TIER), self.celsius_to_fahrenheit if fahrenheit else None)
+
+    def show_chart(self, title, y_label, series_name):
+        with diagnostics.timer("chart.show"):
+            chart = QChart()
+            series = QLineSeries()
+            series.setName(series_name)
+            self.current_series_name = series_name
+
+            # One bulk replace instead of one append per point
+            points = self.query_data(series_name)
+            series.replace(points)
+            chart.addSeries(series)
+
+            # Create a time X axis
+            start, end = self.current_range()
+            axis_x = QDateTimeAxis()
+            axis_x.setFormat(axis_format(end - start))
+            axis_x.setRange(QDateTime.fromSecsSinceEpoch(start), QDateTime.fromSecsSinceEpoch(end))
+            axis_x.setTickCount(7)
+            axis_x.setTitleText("Time")
+            chart.addAxis(axis_x, Qt.AlignBottom)
+            series.attachAxis(axis_x)
+
+            # Create Y axis
+            axis_y = QValueAxis()
+            axis_y.setTitleText(y_label)
+            chart.addAxis(axis_y, Qt.AlignLeft)
+            series.attachAxis(axis_y)
+            self.y_min = math.inf
+            self.y_max = -math.inf
+            self.axis_y = axis_y
+            self.extend_y_range(points)
+
+            # Legende
+            chart.legend().setVisible(True)
+            chart.legend().setAlignment(Qt.AlignBottom)
+
+            chart.setTitle(title)
+            self.chart_view.setChart(chart)
+            self.current_series = series
+            self.axis_x = axis_x
+
+    def extend_y_range(self, points):
+        for point in points:
+            self.y_min = min(self.y_min, point.y())
+            self.y_max = max(self.y_max, point.y())
+        if self.y_min <= self.y_max:
+            margin = max((self.y_max - self.y_min) * 0.05, 1)
+            self.axis_y.setRange(self.y_min - margin, self.y_max + margin)
 
-        self.current_series.clear()
-        for x, y in zip(x_data, y_data):
-            self.current_series.append(x, y)
+    def update_graph(self):
+        # Follow the new samples: slide the time axis, push the new points and drop
+        # the ones that left the range. The cost does not depend on the history size.
+        with diagnostics.timer("chart.update"):
+            if not self.current_series or self.is_custom_range():
+                return
+
+            start, end = self.current_range()
+            self.axis_x.setRange(QDateTime.fromSecsSinceEpoch(start), QDateTime.fromSecsSinceEpoch(end))
+
+            history = self.history(self.current_tier)
+            history.refresh()
+            timestamps, values = self.query_line(history, self.current_series_name, self.shown_until, end)
+            skip = 0
+            while skip < min(self.shown_at_last, len(timestamps)) and timestamps[skip] == self.shown_until:
+                skip += 1
+            timestamps = timestamps[skip:]
+            values = values[skip:]
+            if len(timestamps):
+                self.mark_shown(timestamps)
+                points = self.to_points(self.current_series_name, timestamps, values)
+                self.current_series.append(points)
+                self.extend_y_range(points)
+
+            # The appended points are not decimated, start again once they are too many
+            if self.current_series.count() > 4 * self.chart_width():
+                self.redraw()
+                return
+
+            expired = 0
+            count = self.current_series.count()
+            while expired < count and self.current_series.at(expired).x() < start * 1000:
+                expired += 1
+            if expired:
+                self.current_series.removePoints(0, expired)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.update_timer.isActive():
+            self.update_timer.start(1000)
+            self.summary_timer.start(30 * 1000)
+            self.redraw()
+
+    def closeEvent(self, event):
+        # Hidden until shown again: the tiers are unmapped, and mapped again when needed
+        self.update_timer.stop()
+        self.summary_timer.stop()
+        for history in self.histories.values():
+            history.close()
+        self.histories = {}
+        event.accept()
 
     def celsius_to_fahrenheit(self, celsius):
         return celsius * 9/5 + 32
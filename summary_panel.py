@@ -0,0 +1,96 @@
+import fnmatch
+import math
+import operator
+import time
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView)
+from alert_rules import AlertRule, configured_rules
+from sketches import SketchReader
+
+WINDOWS = [("1 h", 3600), ("24 h", 24 * 3600), ("7 d", 7 * 24 * 3600)]
+COLUMNS = ["Window", "p50", "p95", "p99", "Max", "Mean", "Past threshold"]
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+class SummaryPanel(QWidget):
+    # Quantiles, max, mean and time past the alert threshold of one metric over
+    # the last hour, day and week, from the stored sketches: a few merges per
+    # window, whatever the number of samples
+    def __init__(self, stats_dir, config):
+        super().__init__()
+        self.sketches = SketchReader(stats_dir, max(span for _, span in WINDOWS))
+        self.config = config
+        self.metric = None
+        self.raw = None
+        self.convert = None
+
+        layout = QVBoxLayout()
+        self.title_label = QLabel("Summary")
+        layout.addWidget(self.title_label)
+        self.table = QTableWidget(len(WINDOWS), len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setMaximumHeight(self.table.horizontalHeader().height() + len(WINDOWS) * self.table.verticalHeader().defaultSectionSize() + 4)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def show_metric(self, metric, raw=None, convert=None):
+        # raw: the raw history, for the samples not in a stored bucket yet.
+        # convert: applied to the values shown (°C to °F)
+        self.metric = metric
+        self.raw = raw
+        self.convert = convert
+        self.refresh()
+
+    def threshold(self):
+        # (compare, threshold) of the first alert rule on the metric
+        for text in configured_rules(self.config):
+            try:
+                rule = AlertRule(text)
+            except ValueError:
+                continue
+            if fnmatch.fnmatchcase(self.metric, rule.metric):
+                return rule.compare, rule.threshold
+        return None
+
+    def format_value(self, value):
+        if math.isnan(value) or math.isinf(value):
+            return ""
+        if self.convert:
+            value = self.convert(value)
+        return f"{value:.4g}"
+
+    def refresh(self):
+        if self.metric is None:
+            return
+        if self.raw is not None:
+            # The samples since the last stored bucket
+            self.raw.refresh()
+        now = int(time.time())
+        self.sketches.refresh(now)
+        threshold = self.threshold()
+        self.title_label.setText(f"Summary of {self.metric}" + (f" (threshold {threshold[1]:g})" if threshold else ""))
+        for row, (name, span) in enumerate(WINDOWS):
+            sketch = self.sketches.window(self.metric, span, now, self.raw)
+            cells = [name, "", "", "", "", "", ""]
+            if sketch.weight:
+                cells[1:6] = [self.format_value(value) for value in
+                              (sketch.quantile(0.5), sketch.quantile(0.95), sketch.quantile(0.99), sketch.max, sketch.mean())]
+                if threshold:
+                    compare, level = threshold
+                    past = sketch.weight_above(level) if compare in (operator.gt, operator.ge) else sketch.weight_below(level)
+                    cells[6] = f"{format_duration(past)} ({past / sketch.weight * 100:.1f} %)"
+            for column, text in enumerate(cells):
+                item = self.table.item(row, column)
+                if item is None:
+                    self.table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
@@ -0,0 +1,41 @@
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QTableWidget, QTableWidgetItem, QHeaderView)
+
+RANKING_NAMES = [("CPU", "cpu"), ("RAM", "rss"), ("I/O", "io")]
+
+
+class TopProcessesPanel(QWidget):
+    # Top consumers from the top_processes value of the sampler snapshots
+    def __init__(self):
+        super().__init__()
+        self.top_processes = None
+
+        layout = QVBoxLayout()
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(QLabel("Top processes by"))
+        self.ranking_combo = QComboBox()
+        self.ranking_combo.addItems([name for name, _ in RANKING_NAMES])
+        self.ranking_combo.currentIndexChanged.connect(self.refresh)
+        header_layout.addWidget(self.ranking_combo)
+        layout.addLayout(header_layout)
+
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["Process", "PID", "CPU (%)", "RAM (Mo)", "I/O (Ko/s)"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def update_processes(self, snapshot):
+        if "top_processes" in snapshot:
+            self.top_processes = snapshot["top_processes"]
+            self.refresh()
+
+    def refresh(self):
+        if not self.top_processes:
+            return
+        rows = self.top_processes[RANKING_NAMES[self.ranking_combo.currentIndex()][1]]
+        self.table.setRowCount(len(rows))
+        for row, (pid, name, cpu, rss, io) in enumerate(rows):
+            values = [name, str(pid), f"{cpu:.1f}", f"{rss / (1024 * 1024):.0f}", f"{io / 1024:.0f}"]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))